@@ -1,6 +1,52 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routers import pdf_processing, data_retrieval
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from app.response_cache import ResponseCache
+from app.routers import pdf_processing, data_retrieval, jobs
+from database.connection import DEFAULT_DB_PATH, create_write_connection
+from database.operations import initialize_database
+from database.pool import EXPORT_POOL_SIZE, ReadConnectionPool
+from monitoring import metrics
+from pdf_processing.worker import start_workers, stop_workers
 
-app = FastAPI()
+# Queue worker processes started alongside the API; set to 0 when running
+# `python -m pdf_processing.worker` separately
+QUEUE_WORKERS = int(os.environ.get("PDF_QUEUE_WORKERS", 1))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the schema (and switch the file to WAL mode) before any read-only connection opens it
+    os.makedirs(os.path.dirname(DEFAULT_DB_PATH), exist_ok=True)
+    conn = create_write_connection(DEFAULT_DB_PATH)
+    initialize_database(conn)
+    conn.close()
+
+    # Counters of processes that have exited are dropped; live workers' (e.g. of another API process) are kept
+    metrics.reset_snapshots()
+    app.state.read_pool = ReadConnectionPool(DEFAULT_DB_PATH)
+    if not app.state.read_pool.check():
+        raise RuntimeError(f"Cannot read from database {DEFAULT_DB_PATH}")
+    app.state.export_pool = ReadConnectionPool(DEFAULT_DB_PATH, size=EXPORT_POOL_SIZE)
+    app.state.response_cache = ResponseCache()
+    workers, stop_event = start_workers(QUEUE_WORKERS, DEFAULT_DB_PATH)
+    yield
+    stop_workers(workers, stop_event, timeout=30)
+    app.state.read_pool.close()
+    app.state.export_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(pdf_processing.router)
 app.include_router(data_retrieval.router)
+app.include_router(jobs.router)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Processing counters and latency histograms of the API and worker processes, in Prometheus text format."""
+    # Reads the other processes' snapshot files, so keep it off the event loop
+    return PlainTextResponse(await run_in_threadpool(metrics.render),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1 +1 @@
-from .models import ExtractedData
+from .models import ExtractedData, ProcessedDataPage, TimelineEntry, TimelinePage, SearchHit, JobStatus
@@ -1,8 +1,42 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from datetime import date
 
 class ExtractedData(BaseModel):
+    id: Optional[int] = None
     pdf_id: int
     date_text: str
     context: str
-    page_number: Optional[int] = None
\ No newline at end of file
+    page_number: Optional[int] = None
+
+class ProcessedDataPage(BaseModel):
+    items: List[ExtractedData]
+    next_cursor: Optional[str] = None
+
+class TimelineEntry(ExtractedData):
+    start: date
+    end: date
+    precision: str
+
+class TimelinePage(BaseModel):
+    items: List[TimelineEntry]
+    next_cursor: Optional[str] = None
+
+class SearchHit(ExtractedData):
+    start: Optional[date] = None
+    end: Optional[date] = None
+    precision: Optional[str] = None
+    rank: float
+    snippet: str
+
+class JobStatus(BaseModel):
+    id: int
+    pdf_path: str
+    state: str
+    pdf_id: Optional[int] = None
+    pages_done: int
+    pages_total: Optional[int] = None
+    attempts: int
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Response cache and ETag validation for the retrieval endpoints.
+
+Responses are keyed by path and query parameters and tagged with the database generation
+(see database.generation) they were read at. A request whose If-None-Match carries the ETag
+of the current generation is answered with 304 after reading only the counter; otherwise the
+serialized body is served from an LRU cache bounded by entry count and total size, and the
+query runs only on a miss. Entries of older generations are dropped as soon as a newer one
+is seen. Each API process has its own cache, but ETags are the same in all of them.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from database.generation import fetch_generation
+from database.page_text import CONTEXT_WORDS
+from monitoring import metrics
+
+# Bounds of each process's cache; 0 entries disables caching (ETags are still checked)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+CacheKey = Tuple
+
+
+class ResponseCache:
+    """Thread-safe LRU of serialized response bodies for a single database generation."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _advance(self, generation: int) -> bool:
+        # Called with the lock held; False if the caller read an older generation than the cache holds
+        if self._generation is None or generation > self._generation:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+        return generation == self._generation
+
+    def get(self, key: CacheKey, generation: int) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key) if self._advance(generation) else None
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: CacheKey, generation: int, body: bytes):
+        if len(body) > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            if not self._advance(generation):
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = None
+
+
+def cache_key(path: str, query_items) -> CacheKey:
+    """Key of a request: its path and sorted query parameters, plus the default context width."""
+    return path, tuple(sorted(query_items)), CONTEXT_WORDS
+
+
+def make_etag(key: CacheKey, generation: int) -> str:
+    return f'"{generation}-{hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value matches the ETag (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def cached_json_response(pool, cache: ResponseCache, key: CacheKey, if_none_match: Optional[str],
+                         build: Callable) -> Response:
+    """
+    Answer a retrieval request from the cache, with 304, or by running the query. Blocking; run it in an executor.
+    :param pool: ReadConnectionPool to borrow a connection from.
+    :param cache: The process's ResponseCache.
+    :param key: Key of the request (see cache_key).
+    :param if_none_match: The request's If-None-Match header, if any.
+    :param build: Called as build(conn) on a miss; returns the response model (or a list of models).
+    :return: A response carrying the ETag of the generation the data was read at.
+    """
+    with pool.connection() as conn:
+        # One read transaction, so the generation and the rows come from the same snapshot
+        conn.execute("BEGIN")
+        try:
+            generation = fetch_generation(conn)
+            etag = make_etag(key, generation)
+            # Clients must revalidate, but a matching ETag costs only the counter read
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if etag_matches(if_none_match, etag):
+                metrics.RESPONSE_CACHE.inc(result="not_modified")
+                return Response(status_code=304, headers=headers)
+            body = cache.get(key, generation)
+            if body is None:
+                body = JSONResponse(jsonable_encoder(build(conn))).body
+                cache.put(key, generation, body)
+                metrics.RESPONSE_CACHE.inc(result="miss")
+            else:
+                metrics.RESPONSE_CACHE.inc(result="hit")
+        finally:
+            conn.rollback()
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,2 +1,3 @@
 from .pdf_processing import router as pdf_processing_router
 from .data_retrieval import router as data_retrieval_router
+from .jobs import router as jobs_router
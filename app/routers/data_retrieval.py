@@ -1,19 +1,178 @@
 # app/routers/data_retrieval.py
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Tuple
+from contextlib import ExitStack
+from datetime import date, datetime, timezone
 import asyncio
-from app.models.models import ExtractedData
-from database.operations import sync_fetch_processed_data  # Ensure this function is implemented
+import base64
+import binascii
+import json
+import os
+import zlib
+from app.models.models import ProcessedDataPage, TimelinePage, SearchHit
+from app.response_cache import cache_key, cached_json_response
+from database.operations import fetch_dates_page, fetch_timeline_page, iter_dates_chunks
+from database.pool import PoolTimeout
+from database.search import search_dates
+
 
 router = APIRouter()
 
-@router.get("/processed-data/", response_model=List[ExtractedData])
-async def get_processed_data():
+# Rows read from the cursor and sent per chunk by the export endpoint
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 2000))
+
+# Words on each side of a date a client may ask for; contexts default to database.page_text.CONTEXT_WORDS
+MAX_CONTEXT_WORDS = 500
+
+
+def encode_cursor(*values: int) -> str:
+    return base64.urlsafe_b64encode(",".join(str(value) for value in values).encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int = 1) -> Tuple[int, ...]:
     try:
-        db_path = "data/my_project_database.db"
-        loop = asyncio.get_running_loop()
-        # Ensure sync_fetch_processed_data is defined and correctly fetches data from the database
-        data = await loop.run_in_executor(None, sync_fetch_processed_data, db_path)
-        return data
+        values = tuple(int(value) for value in base64.urlsafe_b64decode(cursor.encode()).decode().split(","))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def to_db_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """Format a datetime the way SQLite's CURRENT_TIMESTAMP stores it (UTC, second precision)."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+async def cached_response(request: Request, build):
+    """
+    Run build(conn) on a pooled read-only connection, unless the response for this request and the
+    current database generation is cached or the client already has it (If-None-Match).
+    """
+    loop = asyncio.get_running_loop()
+    key = cache_key(request.url.path, request.query_params.multi_items())
+    # Executor threads borrow one of the pooled read-only connections opened at startup
+    return await loop.run_in_executor(
+        None, lambda: cached_json_response(request.app.state.read_pool, request.app.state.response_cache, key,
+                                           request.headers.get("if-none-match"), build))
+
+
+@router.get("/processed-data/", response_model=ProcessedDataPage)
+async def get_processed_data(request: Request,
+                             limit: int = Query(100, ge=1, le=1000),
+                             cursor: Optional[str] = None,
+                             pdf_id: Optional[int] = None,
+                             page_from: Optional[int] = None,
+                             page_to: Optional[int] = None,
+                             uploaded_after: Optional[datetime] = None,
+                             uploaded_before: Optional[datetime] = None,
+                             context_words: Optional[int] = Query(None, ge=0, le=MAX_CONTEXT_WORDS)):
+    after_id = decode_cursor(cursor)[0] if cursor else None
+
+    def build(conn):
+        rows, next_after_id = fetch_dates_page(
+            conn, limit=limit, after_id=after_id, pdf_id=pdf_id, page_from=page_from, page_to=page_to,
+            context_words=context_words,
+            uploaded_after=to_db_timestamp(uploaded_after), uploaded_before=to_db_timestamp(uploaded_before))
+        return ProcessedDataPage(items=rows,
+                                 next_cursor=encode_cursor(next_after_id) if next_after_id is not None else None)
+
+    try:
+        return await cached_response(request, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/timeline/", response_model=TimelinePage)
+async def get_timeline(request: Request,
+                       start: Optional[date] = None,
+                       end: Optional[date] = None,
+                       pdf_id: Optional[int] = None,
+                       limit: int = Query(100, ge=1, le=1000),
+                       cursor: Optional[str] = None,
+                       context_words: Optional[int] = Query(None, ge=0, le=MAX_CONTEXT_WORDS)):
+    """Dates whose normalised value starts between start and end (inclusive), in timeline order."""
+    after = decode_cursor(cursor, 2) if cursor else None
+
+    def build(conn):
+        rows, next_after = fetch_timeline_page(
+            conn, limit=limit, pdf_id=pdf_id, after=after, context_words=context_words,
+            start_ordinal=start.toordinal() if start else None, end_ordinal=end.toordinal() if end else None)
+        items = [dict(row, start=date.fromordinal(row["date_start"]), end=date.fromordinal(row["date_end"]),
+                      precision=row["date_precision"]) for row in rows]
+        return TimelinePage(items=items, next_cursor=encode_cursor(*next_after) if next_after is not None else None)
+
+    try:
+        return await cached_response(request, build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/search/", response_model=List[SearchHit])
+async def search(request: Request,
+                 q: str = Query(..., min_length=1),
+                 pdf_id: Optional[int] = None,
+                 start: Optional[date] = None,
+                 end: Optional[date] = None,
+                 limit: int = Query(50, ge=1, le=500),
+                 offset: int = Query(0, ge=0, le=10000),
+                 context_words: Optional[int] = Query(None, ge=0, le=MAX_CONTEXT_WORDS)):
+    """Ranked full-text search over date contexts, optionally limited to a document and a date range."""
+    def build(conn):
+        rows = search_dates(conn, query=q, limit=limit, offset=offset, pdf_id=pdf_id, context_words=context_words,
+                            start_ordinal=start.toordinal() if start else None,
+                            end_ordinal=end.toordinal() if end else None)
+        return [SearchHit(**dict(row,
+                                 start=date.fromordinal(row["date_start"]) if row["date_start"] is not None else None,
+                                 end=date.fromordinal(row["date_end"]) if row["date_end"] is not None else None,
+                                 precision=row["date_precision"])) for row in rows]
+
+    try:
+        return await cached_response(request, build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def ndjson_export(conn, borrowed: ExitStack, compress: bool, filters):
+    """Yield the export body chunk by chunk, then give back the borrowed export connection."""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    with borrowed:
+        for rows in iter_dates_chunks(conn, EXPORT_CHUNK_SIZE, **filters):
+            data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode()
+            if compressor is not None:
+                # Sync-flush so every chunk can be decompressed as soon as it arrives
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+@router.get("/export/dates.ndjson")
+async def export_dates(request: Request,
+                       gzip: bool = False,
+                       pdf_id: Optional[int] = None,
+                       page_from: Optional[int] = None,
+                       page_to: Optional[int] = None,
+                       uploaded_after: Optional[datetime] = None,
+                       uploaded_before: Optional[datetime] = None,
+                       context_words: Optional[int] = Query(None, ge=0, le=MAX_CONTEXT_WORDS)):
+    filters = {"pdf_id": pdf_id, "page_from": page_from, "page_to": page_to, "context_words": context_words,
+               "uploaded_after": to_db_timestamp(uploaded_after), "uploaded_before": to_db_timestamp(uploaded_before)}
+    headers = {"Content-Encoding": "gzip"} if gzip else {}
+    # Exports use their own small pool, and the connection is borrowed before the response starts,
+    # so too many concurrent exports get a 503 instead of a stream cut off partway
+    borrowed = ExitStack()
+    try:
+        conn = await run_in_threadpool(borrowed.enter_context, request.app.state.export_pool.connection())
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Too many exports are running, retry later",
+                            headers={"Retry-After": "30"})
+    # A sync generator: Starlette pulls each chunk from it in a worker thread
+    return StreamingResponse(ndjson_export(conn, borrowed, gzip, filters),
+                             media_type="application/x-ndjson", headers=headers)
@@ -0,0 +1,32 @@
+# app/routers/jobs.py
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from typing import List
+from app.models.models import JobStatus
+from database.jobs import fetch_job, fetch_jobs
+
+router = APIRouter()
+
+
+def pooled_fetch_jobs(pool, job_ids):
+    with pool.connection() as conn:
+        return fetch_jobs(conn, job_ids)
+
+
+def pooled_fetch_job(pool, job_id):
+    with pool.connection() as conn:
+        return fetch_job(conn, job_id)
+
+
+@router.get("/jobs/", response_model=List[JobStatus])
+async def get_jobs(request: Request, ids: List[int] = Query(...)):
+    """Status and page progress of several jobs, e.g. all jobs of one upload: /jobs/?ids=1&ids=2"""
+    return await run_in_threadpool(pooled_fetch_jobs, request.app.state.read_pool, ids)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(request: Request, job_id: int):
+    job = await run_in_threadpool(pooled_fetch_job, request.app.state.read_pool, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
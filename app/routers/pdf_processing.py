@@ -1,23 +1,228 @@
-from fastapi import APIRouter, BackgroundTasks, File, UploadFile
-from typing import List
-from pdf_processing.processor import process_and_store_pdfs  # Adjust import path as needed
+from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
+from database.connection import DEFAULT_DB_PATH, create_write_connection
+from database.jobs import enqueue_jobs, fetch_paths_by_hash, queue_depth
+from pdf_processing.hashing import file_sha256
+import hashlib
 import os
+import tempfile
+import uuid
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart before 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
 
 router = APIRouter()
 
-@router.post("/upload-pdfs/")
-async def upload_pdfs(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
+# Size limits per uploaded file and per request, in bytes
+MAX_FILE_BYTES = int(os.environ.get("UPLOAD_MAX_FILE_BYTES", 1024 ** 3))
+MAX_REQUEST_BYTES = int(os.environ.get("UPLOAD_MAX_REQUEST_BYTES", 4 * 1024 ** 3))
+
+# Uploads are refused with 429 while this many jobs are queued or running
+MAX_QUEUE_DEPTH = int(os.environ.get("MAX_QUEUE_DEPTH", 1000))
+
+# Form field the PDFs are uploaded in
+UPLOAD_FIELD = "files"
+
+
+class UploadWriter:
+    """
+    Callbacks for python-multipart's streaming parser that write each uploaded file straight to
+    data_dir, hashing it on the way, so an upload is stored exactly once and never spooled first.
+    A file is written under a temporary name and renamed into place only when complete, and gets
+    a unique prefix so uploads with the same filename never overwrite each other.
+    """
+
+    def __init__(self, data_dir: str, max_file_bytes: int):
+        self.data_dir = data_dir
+        self.max_file_bytes = max_file_bytes
+        # (filename, path of the stored file, SHA-256 hex digest, size in bytes) per completed file
+        self.files = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._filename: Optional[str] = None
+        self._out_file = None
+        self._tmp_path: Optional[str] = None
+        self._sha = None
+        self._size = 0
+
+    def callbacks(self):
+        return {"on_part_begin": self.on_part_begin, "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end, "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value, "on_header_end": self.on_header_end,
+                "on_headers_finished": self.on_headers_finished}
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode("latin-1") != UPLOAD_FIELD or b"filename" not in options:
+            # Other form fields are ignored
+            return
+        filename = os.path.basename(options[b"filename"].decode("utf-8", errors="replace")) or "upload.pdf"
+        fd, self._tmp_path = tempfile.mkstemp(dir=self.data_dir, suffix=".part")
+        self._out_file = os.fdopen(fd, "wb")
+        self._filename = filename
+        self._sha = hashlib.sha256()
+        self._size = 0
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._out_file is None:
+            return
+        chunk = data[start:end]
+        self._size += len(chunk)
+        if self._size > self.max_file_bytes:
+            raise HTTPException(status_code=413, detail=f"'{self._filename}' exceeds the upload size limit")
+        self._sha.update(chunk)
+        self._out_file.write(chunk)
+
+    def on_part_end(self):
+        if self._out_file is None:
+            return
+        self._out_file.close()
+        self._out_file = None
+        out_file_path = os.path.join(self.data_dir, f"{uuid.uuid4().hex}_{self._filename}")
+        os.replace(self._tmp_path, out_file_path)
+        self._tmp_path = None
+        self.files.append((self._filename, out_file_path, self._sha.hexdigest(), self._size))
+
+    def discard(self):
+        """Remove everything written so far; a rejected request leaves nothing behind to be processed."""
+        if self._out_file is not None:
+            self._out_file.close()
+            self._out_file = None
+        if self._tmp_path is not None and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        for _, path, _, _ in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+        self.files = []
+
+
+async def receive_uploads(request: Request, data_dir: str) -> List[tuple]:
+    """
+    Parse a multipart/form-data body as it arrives and store the files of its UPLOAD_FIELD field.
+    Parsing and writing run in a worker thread, one received chunk at a time.
+    :return: (filename, stored path, SHA-256 hex digest, size) per file, in upload order.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data upload")
+    writer = UploadWriter(data_dir, MAX_FILE_BYTES)
+    parser = MultipartParser(boundary, writer.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            # Also covers requests sent without a Content-Length (chunked transfer encoding)
+            if received > MAX_REQUEST_BYTES:
+                raise HTTPException(status_code=413, detail="Request exceeds the upload size limit")
+            await run_in_threadpool(parser.write, chunk)
+        await run_in_threadpool(parser.finalize)
+    except BaseException:
+        await run_in_threadpool(writer.discard)
+        raise
+    return writer.files
+
+
+def pooled_queue_depth(pool):
+    with pool.connection() as conn:
+        return queue_depth(conn)
+
+
+def _is_reusable(path: str, data_dir: str, content_hash: str, size: int) -> bool:
+    # Only files the API stored itself; anything else (e.g. a bulk-ingested archive) may change or disappear
+    data_dir = os.path.realpath(data_dir)
+    try:
+        if os.path.commonpath([os.path.realpath(path), data_dir]) != data_dir:
+            return False
+        # Re-hashed, so the new upload is only deleted once the kept file is known to hold the same bytes
+        return os.path.getsize(path) == size and file_sha256(path) == content_hash
+    except (OSError, ValueError):  # ValueError: on another drive than data_dir
+        return False
+
+
+def reuse_stored_copies(pool, files, data_dir):
+    """
+    Drop the new copy of every upload whose content is already in a file the API stored in data_dir:
+    an earlier file of the same request, or the file of an earlier job or stored PDF. The job then
+    points at that file, so re-uploading the same document does not leave another full copy.
+    :param pool: ReadConnectionPool to look the hashes up with.
+    :param files: (filename, stored path, SHA-256 hex digest, size) per upload, as from receive_uploads.
+    :param data_dir: Directory the uploads are stored in.
+    :return: The same list, with paths replaced where a copy was reused.
+    """
+    with pool.connection() as conn:
+        known_paths = fetch_paths_by_hash(conn, [content_hash for _, _, content_hash, _ in files])
+    seen = {}
+    result = []
+    for filename, path, content_hash, size in files:
+        existing = seen.get(content_hash)
+        if existing is None:
+            existing = next((known for known in known_paths.get(content_hash, ())
+                             if known != path and _is_reusable(known, data_dir, content_hash, size)), None)
+        if existing is not None and existing != path:
+            os.remove(path)
+            path = existing
+        seen[content_hash] = path
+        result.append((filename, path, content_hash, size))
+    return result
+
+
+def enqueue_uploads(db_path, items):
+    conn = create_write_connection(db_path)
+    try:
+        return enqueue_jobs(conn, items)
+    finally:
+        conn.close()
+
+
+@router.post("/upload-pdfs/", openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {
+    "schema": {"type": "object", "required": [UPLOAD_FIELD],
+               "properties": {UPLOAD_FIELD: {"type": "array", "items": {"type": "string", "format": "binary"}}}}}}}})
+async def upload_pdfs(request: Request):
+    # The body is read by receive_uploads, not by FastAPI, so these checks run before any of it is received
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+        raise HTTPException(status_code=413, detail="Request exceeds the upload size limit")
+    # Backpressure: refuse new work before receiving anything when the workers are behind
+    depth = await run_in_threadpool(pooled_queue_depth, request.app.state.read_pool)
+    if depth >= MAX_QUEUE_DEPTH:
+        raise HTTPException(status_code=429, detail="Processing queue is full, retry later",
+                            headers={"Retry-After": "30"})
+
     data_dir = "data"
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
-        
-    saved_paths = []
-    for file in files:
-        out_file_path = os.path.join(data_dir, file.filename)
-        with open(out_file_path, "wb") as out_file:
-            content = await file.read()  # Read file content
-            out_file.write(content)  # Write to disk
-        saved_paths.append(out_file_path)
-    
-    background_tasks.add_task(process_and_store_pdfs, saved_paths, os.path.join(data_dir, 'my_project_database.db'))
-    return {"message": "PDFs are being processed in the background."}
+
+    files = await receive_uploads(request, data_dir)
+    if not files:
+        raise HTTPException(status_code=422, detail=f"No files in the '{UPLOAD_FIELD}' field")
+    # The file count is only known now; the queue may also have grown while the body was received
+    if depth + len(files) > MAX_QUEUE_DEPTH:
+        for _, path, _, _ in files:
+            os.remove(path)
+        raise HTTPException(status_code=429, detail="Processing queue is full, retry later",
+                            headers={"Retry-After": "30"})
+
+    files = await run_in_threadpool(reuse_stored_copies, request.app.state.read_pool, files, data_dir)
+    job_ids = await run_in_threadpool(enqueue_uploads, DEFAULT_DB_PATH,
+                                      [(path, content_hash) for _, path, content_hash, _ in files])
+    return {"message": "PDFs are being processed in the background.",
+            "jobs": [{"job_id": job_id, "filename": filename} for job_id, (filename, _, _, _) in zip(job_ids, files)]}
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark for the SQLite write path: per-row commits vs one transaction per PDF.
+
+Usage: python -m benchmarks.bench_db_writes [--pdfs 20] [--dates 3000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from database.connection import create_connection, create_write_connection
+from database.operations import initialize_database, insert_pdf_data, insert_date_data, insert_pdf_with_dates
+
+
+def _fake_dates(count):
+    return [{"text": f"March {i % 28 + 1}, 2021", "context": "the agreement terminates on March 3, 2021 unless renewed " * 4,
+             "page_number": i // 10 + 1} for i in range(count)]
+
+
+def bench_per_row(db_path, pdfs, dates):
+    conn = create_connection(db_path)
+    initialize_database(conn)
+    start = time.perf_counter()
+    for n in range(pdfs):
+        pdf_id = insert_pdf_data(conn, f"doc{n}.pdf", f"doc{n}.pdf", False)
+        for date in dates:
+            insert_date_data(conn, pdf_id, date["text"], date["context"], date["page_number"])
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def bench_bulk(db_path, pdfs, dates):
+    conn = create_write_connection(db_path)
+    initialize_database(conn)
+    start = time.perf_counter()
+    for n in range(pdfs):
+        insert_pdf_with_dates(conn, f"doc{n}.pdf", f"doc{n}.pdf", False, dates)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row and bulk SQLite write throughput.")
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--dates", type=int, default=3000, help="Dates per PDF")
+    args = parser.parse_args()
+
+    dates = _fake_dates(args.dates)
+    rows = args.pdfs * (args.dates + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, bench in (("per-row commits", bench_per_row), ("bulk transaction", bench_bulk)):
+            elapsed = bench(os.path.join(tmp, f"{bench.__name__}.db"), args.pdfs, dates)
+            print(f"{name:>17}: {rows} rows in {elapsed:.2f}s = {rows / elapsed:,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
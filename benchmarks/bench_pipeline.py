@@ -0,0 +1,361 @@
+"""
+Stage-by-stage and end-to-end throughput benchmark over a synthetic corpus.
+
+Usage: python -m benchmarks.bench_pipeline [--kind mixed] [--docs 10] [--pages 20] [--dates-per-page 3]
+                                           [--stages text,ocr_check,regex,ner,db,api,end_to_end]
+                                           [--workers 1 | --sweep-workers 1,2,4] [--out results.json]
+                                           [--baseline previous.json]
+
+Stages:
+- text: native text extraction with PyMuPDF (iter_page_texts without OCR)
+- ocr_check: deciding which pages need OCR
+- ocr: running OCR on those pages (only when requested; needs ocrmypdf)
+- regex: the regex pre-filter and date regex
+- ner: date extraction through nlp.pipe
+- db: storing the extracted dates, one transaction per PDF
+- api: the retrieval endpoints, through the FastAPI test client; uncached, and for repeated polls
+       served from the response cache or answered 304
+- end_to_end: process_and_store_pdfs on the whole corpus; with --sweep-workers, once per worker
+              count on a fresh database, reporting each run's speedup over the first count
+
+Each stage reports pages/s, dates/s where it applies, per-item latency percentiles and the
+process's peak RSS so far. Peak RSS only grows during a run, so it is the high-water mark of
+all stages up to and including the one reported. The results are written as JSON; with
+--baseline, throughput is compared to an earlier result file and drops beyond --tolerance
+are reported as regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List
+
+from benchmarks.corpus import KINDS, generate_corpus
+
+STAGES = ("text", "ocr_check", "ocr", "regex", "ner", "db", "api", "end_to_end")
+DEFAULT_STAGES = ("text", "ocr_check", "regex", "ner", "db", "api", "end_to_end")
+
+# Requests per retrieval endpoint in the api stage
+API_REQUESTS = 50
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds (nearest-rank)."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {}
+    for p in (50, 90, 99):
+        rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+        result[f"p{p}_ms"] = round(ordered[rank] * 1000, 3)
+    result["max_ms"] = round(ordered[-1] * 1000, 3)
+    return result
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _timed(items: Iterable[Any], work: Callable[[Any], Any]):
+    """Run work on each item; return (results, per-item latencies, total seconds)."""
+    results = []
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        item_start = time.perf_counter()
+        results.append(work(item))
+        latencies.append(time.perf_counter() - item_start)
+    return results, latencies, time.perf_counter() - start
+
+
+def _report(seconds: float, latencies: List[float], pages: int = None, dates: int = None, **extra) -> Dict[str, Any]:
+    report = {"seconds": round(seconds, 4)}
+    if pages is not None:
+        report["pages"] = pages
+        report["pages_per_s"] = round(pages / seconds, 2) if seconds else None
+    if dates is not None:
+        report["dates"] = dates
+        report["dates_per_s"] = round(dates / seconds, 2) if seconds else None
+    if latencies:
+        report["latency"] = percentiles(latencies)
+    report["peak_rss_mb"] = peak_rss_mb()
+    report.update(extra)
+    return report
+
+
+def bench_text(paths):
+    from pdf_processing.processor import iter_page_texts
+    page_texts, latencies, seconds = _timed(paths, lambda path: list(iter_page_texts(path, ocr=False)))
+    return _report(seconds, latencies, pages=sum(map(len, page_texts)), unit="document"), page_texts
+
+
+def bench_ocr_check(page_texts):
+    from pdf_processing.processor import MIN_PAGE_TEXT_CHARS
+    pages = [text for doc in page_texts for _, text in doc]
+    needs_ocr, latencies, seconds = _timed(pages, lambda text: len(text.strip()) < MIN_PAGE_TEXT_CHARS)
+    return _report(seconds, latencies, pages=len(pages), unit="page", pages_needing_ocr=sum(needs_ocr))
+
+
+def bench_ocr(paths, tmp_dir):
+    from pdf_processing.processor import MIN_PAGE_TEXT_CHARS, get_ocr_scheduler, iter_page_texts
+
+    def ocr_document(path):
+        blank = [n for n, text in iter_page_texts(path, ocr=False) if len(text.strip()) < MIN_PAGE_TEXT_CHARS]
+        if not blank:
+            return 0
+        output = os.path.join(tmp_dir, os.path.basename(path) + "_ocr.pdf")
+        result = get_ocr_scheduler().run(path, output, blank)
+        if result["error"]:
+            raise RuntimeError(f"OCR failed for {path}: {result['error']}")
+        return len(blank)
+
+    ocr_pages, latencies, seconds = _timed(paths, ocr_document)
+    return _report(seconds, latencies, pages=sum(ocr_pages), unit="document",
+                   peak_rss_children_mb=peak_rss_mb(children=True))
+
+
+def bench_regex(page_texts):
+    from pdf_processing.processor import date_regex, page_may_contain_dates
+
+    def scan(text):
+        return len(date_regex.findall(text)) if page_may_contain_dates(text) else 0
+
+    pages = [text for doc in page_texts for _, text in doc]
+    counts, latencies, seconds = _timed(pages, scan)
+    return _report(seconds, latencies, pages=len(pages), dates=sum(counts), unit="page")
+
+
+def bench_ner(page_texts):
+    from collections import Counter
+    from pdf_processing.processor import extract_dates_from_pages
+    stats = Counter()
+    # Offsets only, as the pipeline stores them; results are (dates, texts of pages with dates) per document
+    results, latencies, seconds = _timed(page_texts, lambda doc: _extract_with_texts(extract_dates_from_pages, doc, stats))
+    return _report(seconds, latencies, pages=stats["pages"], dates=sum(len(dates) for dates, _ in results),
+                   unit="document", pages_skipped=stats["pages_skipped"]), results
+
+
+def _extract_with_texts(extract_dates_from_pages, doc, stats):
+    texts = {}
+    dates = list(extract_dates_from_pages(doc, context_words=None, stats=stats, page_texts=texts))
+    return dates, texts
+
+
+def bench_db(paths, extracted, db_path):
+    from database.connection import create_write_connection
+    from database.operations import initialize_database, insert_pdf_with_dates
+    conn = create_write_connection(db_path)
+    try:
+        initialize_database(conn)
+        _, latencies, seconds = _timed(zip(paths, extracted), lambda item: insert_pdf_with_dates(
+            conn, item[0], item[0], False, item[1][0], page_texts=item[1][1]))
+    finally:
+        conn.close()
+    return _report(seconds, latencies, dates=sum(len(dates) for dates, _ in extracted), unit="document",
+                   db_bytes=os.path.getsize(db_path))
+
+
+def bench_api(db_path):
+    try:
+        from fastapi.testclient import TestClient
+    except (ImportError, RuntimeError) as e:
+        return {"skipped": f"FastAPI test client unavailable: {e}"}
+    from app.main import app
+    from app.response_cache import ResponseCache
+    from database.pool import EXPORT_POOL_SIZE, ReadConnectionPool
+
+    # The lifespan is not entered, so no queue workers start; the pools read the benchmark database
+    app.state.read_pool = ReadConnectionPool(db_path)
+    app.state.export_pool = ReadConnectionPool(db_path, size=EXPORT_POOL_SIZE)
+    client = TestClient(app)
+    processed_data = "/processed-data/?limit=100"
+    requests = {
+        "processed_data": (processed_data, False),
+        "timeline": ("/timeline/?start=1950-01-01&end=2030-12-31&limit=100", False),
+        "search": ("/search/?q=milestone&limit=20", False),
+        "export": ("/export/dates.ndjson", False),
+        # Repeated polls: served from the response cache, or answered 304 by ETag
+        "processed_data_cached": (processed_data, True),
+        "processed_data_not_modified": (processed_data, True),
+    }
+    report = {}
+    try:
+        for name, (url, cached) in requests.items():
+            # Uncached entries run the query on every request, as they did before the cache existed
+            app.state.response_cache = ResponseCache() if cached else ResponseCache(max_entries=0)
+            headers = {}
+            if name == "processed_data_not_modified":
+                headers["If-None-Match"] = client.get(url).headers["ETag"]
+
+            def get(_):
+                response = client.get(url, headers=headers)
+                if response.status_code != 304:
+                    response.raise_for_status()
+                return len(response.content)
+            sizes, latencies, seconds = _timed(range(API_REQUESTS), get)
+            report[name] = _report(seconds, latencies, unit="request", requests=API_REQUESTS,
+                                   requests_per_s=round(API_REQUESTS / seconds, 2), response_bytes=sizes[0])
+    finally:
+        app.state.read_pool.close()
+        app.state.export_pool.close()
+    return report
+
+
+def bench_end_to_end(paths, db_path, workers, pages):
+    from database.connection import create_connection
+    from pdf_processing.processor import process_and_store_pdfs
+    start = time.perf_counter()
+    process_and_store_pdfs(paths, db_path, workers=workers)
+    seconds = time.perf_counter() - start
+    conn = create_connection(db_path)
+    try:
+        dates = conn.execute("SELECT COUNT(*) FROM Dates").fetchone()[0]
+    finally:
+        conn.close()
+    return _report(seconds, [], pages=pages, dates=dates, unit="corpus", workers=workers,
+                   peak_rss_children_mb=peak_rss_mb(children=True))
+
+
+def bench_end_to_end_sweep(paths, tmp_dir, worker_counts, pages):
+    """Run the end_to_end stage once per worker count, each on its own database so nothing is cached."""
+    runs = {}
+    for workers in worker_counts:
+        runs[f"workers_{workers}"] = bench_end_to_end(paths, os.path.join(tmp_dir, f"end_to_end_{workers}.db"),
+                                                      workers, pages)
+    base_seconds = runs[f"workers_{worker_counts[0]}"]["seconds"]
+    for run in runs.values():
+        run["speedup"] = round(base_seconds / run["seconds"], 2) if run["seconds"] else None
+    return runs
+
+
+def scaling_table(sweep: Dict[str, Any]) -> str:
+    """Plain-text table of an end_to_end sweep, one row per worker count."""
+    lines = [f"{'workers':>7}  {'seconds':>9}  {'pages/s':>9}  {'dates/s':>9}  {'speedup':>7}"]
+    for run in sweep.values():
+        lines.append(f"{run['workers']:>7}  {run['seconds']:>9.2f}  {run['pages_per_s'] or 0:>9.2f}  "
+                     f"{run['dates_per_s'] or 0:>9.2f}  {run['speedup'] or 0:>7.2f}")
+    return "\n".join(lines)
+
+
+def run_benchmarks(args) -> Dict[str, Any]:
+    stages = args.stages
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        paths = generate_corpus(os.path.join(tmp, "corpus"), args.kind, args.docs, args.pages,
+                                args.dates_per_page, args.seed)
+        results["corpus"] = {"seconds": round(time.perf_counter() - start, 4), "documents": len(paths),
+                             "bytes": sum(os.path.getsize(path) for path in paths)}
+
+        # Later stages consume earlier stages' output, so those run whenever something needs them
+        page_texts = extracted = None
+        if stages & {"text", "ocr_check", "regex", "ner", "db", "api"}:
+            results["text"], page_texts = bench_text(paths)
+        if "ocr_check" in stages:
+            results["ocr_check"] = bench_ocr_check(page_texts)
+        if "ocr" in stages:
+            results["ocr"] = bench_ocr(paths, tmp)
+        if "regex" in stages:
+            results["regex"] = bench_regex(page_texts)
+        if stages & {"ner", "db", "api"}:
+            results["ner"], extracted = bench_ner(page_texts)
+        if stages & {"db", "api"}:
+            results["db"] = bench_db(paths, extracted, os.path.join(tmp, "stages.db"))
+        if "api" in stages:
+            results["api"] = bench_api(os.path.join(tmp, "stages.db"))
+        if "end_to_end" in stages and args.sweep_workers:
+            results["end_to_end"] = {"sweep": bench_end_to_end_sweep(paths, tmp, args.sweep_workers,
+                                                                     args.docs * args.pages)}
+        elif "end_to_end" in stages:
+            results["end_to_end"] = bench_end_to_end(paths, os.path.join(tmp, "end_to_end.db"), args.workers,
+                                                     args.docs * args.pages)
+    return {k: v for k, v in results.items() if k == "corpus" or k in stages}
+
+
+def _throughputs(results: Dict[str, Any], prefix: str = ""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _throughputs(value, f"{prefix}{key}.")
+        elif key.endswith("_per_s") and value:
+            yield prefix + key, value
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    :return: Descriptions of the throughput figures that dropped by more than tolerance (a fraction)
+             compared to the baseline.
+    """
+    current = dict(_throughputs(results["stages"]))
+    regressions = []
+    for name, old in _throughputs(baseline.get("stages", {})):
+        new = current.get(name)
+        if new is not None and new < old * (1 - tolerance):
+            regressions.append(f"{name}: {old:,.2f} -> {new:,.2f} ({(new / old - 1) * 100:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF pipeline stage by stage and end to end.")
+    parser.add_argument("--kind", choices=KINDS, default="mixed")
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--dates-per-page", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=",".join(DEFAULT_STAGES),
+                        help=f"Comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the end_to_end stage")
+    parser.add_argument("--sweep-workers",
+                        help="Comma-separated worker counts; runs the end_to_end stage once per count instead")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier result file to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed throughput drop before reporting a regression")
+    args = parser.parse_args()
+    args.stages = set(args.stages.split(","))
+    try:
+        args.sweep_workers = [int(count) for count in args.sweep_workers.split(",")] if args.sweep_workers else None
+    except ValueError:
+        parser.error("--sweep-workers expects comma-separated integers, e.g. 1,2,4")
+    if args.sweep_workers and min(args.sweep_workers) < 1:
+        parser.error("--sweep-workers counts must be at least 1")
+    unknown = args.stages - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+
+    from pdf_processing.processor import EXTRACTOR_VERSION
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "extractor_version": EXTRACTOR_VERSION,
+            "corpus": {"kind": args.kind, "docs": args.docs, "pages": args.pages,
+                       "dates_per_page": args.dates_per_page, "seed": args.seed},
+        },
+        "stages": run_benchmarks(args),
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["stages"], indent=2))
+    if "sweep" in results["stages"].get("end_to_end", {}):
+        print(scaling_table(results["stages"]["end_to_end"]["sweep"]))
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
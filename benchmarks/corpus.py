@@ -0,0 +1,136 @@
+"""
+Reproducible synthetic PDF corpora for the benchmarks.
+
+Usage: python -m benchmarks.corpus OUT_DIR [--kind mixed] [--docs 10] [--pages 20] [--dates-per-page 3] [--seed 0]
+
+Three kinds of document are generated with PyMuPDF:
+- native: every page carries a text layer,
+- image: every page is a rendered image with no text layer, so it needs OCR,
+- mixed: every IMAGE_PAGE_EVERY-th page is an image, the rest are native.
+The same arguments always produce the same files.
+"""
+import argparse
+import os
+import random
+from typing import List
+
+import fitz  # PyMuPDF
+
+KINDS = ("native", "image", "mixed")
+
+# In mixed documents, one page in this many is image-only
+IMAGE_PAGE_EVERY = 4
+
+# Resolution used when rasterising image-only pages; high enough for OCR to read
+IMAGE_DPI = 150
+
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December"]
+
+_FILLER = ["The parties agree to the terms set out in this section.",
+           "Payment is due within thirty days of the invoice.",
+           "Either party may terminate this agreement with written notice.",
+           "The contractor shall maintain adequate insurance at all times.",
+           "All notices must be delivered to the addresses listed above.",
+           "This clause survives the expiry of the agreement."]
+
+
+def _random_date(rng: random.Random) -> str:
+    year = rng.randint(1950, 2030)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    style = rng.randrange(4)
+    if style == 0:
+        return f"{_MONTHS[month - 1]} {day}, {year}"
+    if style == 1:
+        return f"{month:02d}/{day:02d}/{year}"
+    if style == 2:
+        return f"{year}-{month:02d}-{day:02d}"
+    return f"{day} {_MONTHS[month - 1]} {year}"
+
+
+def page_text(rng: random.Random, page_number: int, dates_per_page: int, sentences: int = 12) -> str:
+    """Build the text of one page: filler sentences with exactly dates_per_page dates mixed in."""
+    lines = [rng.choice(_FILLER) for _ in range(sentences)]
+    for n in range(dates_per_page):
+        position = rng.randrange(len(lines) + 1)
+        lines.insert(position, f"The milestone was recorded on {_random_date(rng)}.")
+    return f"Section {page_number}\n" + "\n".join(lines)
+
+
+def _add_native_page(doc, text: str):
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(54, 54, page.rect.width - 54, page.rect.height - 54), text, fontsize=10)
+
+
+def _add_image_page(doc, text: str):
+    # Lay the text out on a scratch page, rasterise it and place only the picture in the document
+    with fitz.open() as scratch:
+        _add_native_page(scratch, text)
+        pixmap = scratch[0].get_pixmap(dpi=IMAGE_DPI)
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=pixmap)
+
+
+def is_image_page(kind: str, page_index: int) -> bool:
+    if kind == "image":
+        return True
+    if kind == "mixed":
+        return page_index % IMAGE_PAGE_EVERY == IMAGE_PAGE_EVERY - 1
+    return False
+
+
+def generate_pdf(path: str, kind: str, pages: int, dates_per_page: int, seed: int):
+    """
+    Write one synthetic PDF.
+    :param path: Output file path.
+    :param kind: One of KINDS.
+    :param pages: Number of pages.
+    :param dates_per_page: Number of dates written on each page.
+    :param seed: Seed for the text and dates; equal seeds give equal documents.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown corpus kind '{kind}'; expected one of {', '.join(KINDS)}")
+    rng = random.Random(seed)
+    with fitz.open() as doc:
+        for page_index in range(pages):
+            text = page_text(rng, page_index + 1, dates_per_page)
+            if is_image_page(kind, page_index):
+                _add_image_page(doc, text)
+            else:
+                _add_native_page(doc, text)
+        # Fixed metadata keeps the output byte-for-byte stable across runs
+        doc.set_metadata({"title": os.path.basename(path), "creationDate": "D:20000101000000", "modDate": "D:20000101000000"})
+        doc.save(path, garbage=3, deflate=True, no_new_id=True)
+
+
+def generate_corpus(out_dir: str, kind: str = "mixed", docs: int = 10, pages: int = 20,
+                    dates_per_page: int = 3, seed: int = 0) -> List[str]:
+    """
+    Write a corpus of synthetic PDFs into out_dir.
+    :return: The paths of the generated files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for n in range(docs):
+        path = os.path.join(out_dir, f"{kind}_{n:04d}.pdf")
+        generate_pdf(path, kind, pages, dates_per_page, seed * 100003 + n)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic PDF corpus.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--kind", choices=KINDS, default="mixed")
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--dates-per-page", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.out_dir, args.kind, args.docs, args.pages, args.dates_per_page, args.seed)
+    print(f"Wrote {len(paths)} PDF(s) to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
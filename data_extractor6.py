@@ -6,7 +6,7 @@ import tempfile
 import fitz  # PyMuPDF
 import spacy
 import re
-from typing import List, Dict
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
 import sqlite3
 from sqlite3 import Error
 
@@ -130,16 +130,36 @@ def extract_dates_from_text(text: str, context_words: int = 50) -> List[Dict[str
     return dates
 
 
+def iter_page_texts(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yield the text of a PDF one page at a time so the whole document is never held in memory.
+    :param pdf_path: Path to the PDF file.
+    :return: Iterator of (page_number, text) tuples; page numbers start at 1.
+    """
+    with fitz.open(pdf_path) as doc:
+        for page_index, page in enumerate(doc):
+            yield page_index + 1, page.get_text()
+
+
+def extract_dates_from_pages(pages: Iterable[Tuple[int, str]], context_words: int = 50) -> Iterator[Dict[str, Any]]:
+    """
+    Run date extraction page by page and stream the results onward.
+    :param pages: Iterable of (page_number, text) tuples, e.g. from iter_page_texts.
+    :param context_words: Number of words of context to keep on each side of a date.
+    :return: Iterator of date dicts with "text", "context" and "page_number" keys.
+    """
+    for page_number, text in pages:
+        for date in extract_dates_from_text(text, context_words):
+            date["page_number"] = page_number
+            yield date
+
+
 def process_pdfs(pdf_paths: List[str]) -> List[Dict[str, Any]]:
     processed_data = []
     ocr_pdf_paths = perform_ocr_if_needed(pdf_paths)
     for ocr_pdf_path in ocr_pdf_paths:
         try:
-            extracted_text = ""
-            with fitz.open(ocr_pdf_path) as doc:
-                for page in doc:
-                    extracted_text += page.get_text()
-            dates = extract_dates_from_text(extracted_text)
+            dates = list(extract_dates_from_pages(iter_page_texts(ocr_pdf_path)))
             processed_data.append({"pdf_path": ocr_pdf_path, "dates": dates})
         except Exception as e:
             logger.error(f"Error processing PDF '{ocr_pdf_path}': {e}")
@@ -187,14 +207,9 @@ def process_and_store_pdfs(pdf_paths: List[str], db_path: str):
         ocr_pdf_paths = perform_ocr_if_needed([pdf_path])
         for ocr_pdf_path in ocr_pdf_paths:
             try:
-                extracted_text = ""
-                with fitz.open(ocr_pdf_path) as doc:
-                    for page in doc:
-                        extracted_text += page.get_text()
-                dates = extract_dates_from_text(extracted_text)
                 pdf_id = insert_pdf_data(conn, pdf_path, ocr_pdf_path, ocr_pdf_path != pdf_path)
-                for date in dates:
-                    insert_date_data(conn, pdf_id, date['text'], date['context'], 0) # Assuming 0 as a placeholder for page number
+                for date in extract_dates_from_pages(iter_page_texts(ocr_pdf_path)):
+                    insert_date_data(conn, pdf_id, date['text'], date['context'], date['page_number'])
             except Exception as e:
                 logger.error(f"Error processing PDF '{ocr_pdf_path}': {e}")
     conn.close()
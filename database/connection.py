@@ -1,10 +1,14 @@
 import sqlite3
 import logging
+import os
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Database used by the API and the background processing
+DEFAULT_DB_PATH = os.path.join("data", "my_project_database.db")
+
 def create_connection(db_file):
     """Create a database connection to the SQLite database specified by db_file."""
     conn = None
@@ -13,4 +17,30 @@ def create_connection(db_file):
         logger.info(f"Connection to {db_file} is established.")
     except sqlite3.Error as e:
         logger.error(f"Failed to create a database connection to {db_file}: {e}")
-    return conn
\ No newline at end of file
+    return conn
+
+# Applied to connections that write. WAL lets readers run alongside the writer; synchronous=NORMAL
+# only fsyncs at checkpoints, which is safe in WAL mode; foreign_keys makes ON DELETE CASCADE work.
+WRITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",  # 64 MiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+)
+
+def create_write_connection(db_file):
+    """Create a connection tuned for bulk writes to the SQLite database specified by db_file."""
+    conn = create_connection(db_file)
+    if conn is not None:
+        try:
+            for pragma in WRITE_PRAGMAS:
+                conn.execute(pragma)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to configure write connection to {db_file}: {e}")
+    return conn
+
+def database_file(conn):
+    """Path of the file a connection's main database is stored in; empty for an in-memory database."""
+    return conn.execute("PRAGMA database_list").fetchone()[2]
@@ -0,0 +1,28 @@
+"""
+Database generation counter.
+
+Every write that can change what the retrieval endpoints return increments a single
+counter in the same transaction. Readers that see the same generation see the same data,
+so responses can be cached and validated by generation (see app.response_cache) without
+looking at the rows themselves.
+"""
+
+sql_create_data_version_table = """CREATE TABLE IF NOT EXISTS DataVersion (
+                                id INTEGER PRIMARY KEY CHECK (id = 1),
+                                generation INTEGER NOT NULL
+                            );"""
+
+
+def create_data_version_table(conn):
+    conn.execute(sql_create_data_version_table)
+    conn.execute("INSERT OR IGNORE INTO DataVersion(id, generation) VALUES (1, 0)")
+
+
+def bump_generation(cur):
+    """Increment the generation; call inside the transaction that changes the data."""
+    cur.execute("UPDATE DataVersion SET generation = generation + 1 WHERE id = 1")
+
+
+def fetch_generation(conn) -> int:
+    row = conn.execute("SELECT generation FROM DataVersion WHERE id = 1").fetchone()
+    return row[0] if row is not None else 0
@@ -0,0 +1,174 @@
+"""
+A durable processing queue stored in the Jobs table.
+
+Each uploaded PDF becomes one job. Workers claim a job by taking a time-limited lease on it and
+keep extending the lease while they work; a job whose lease runs out (its worker crashed or was
+killed) is handed to the next worker that asks, up to MAX_JOB_ATTEMPTS times.
+"""
+import os
+import time
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Seconds a claimed job stays leased without a heartbeat
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+
+# Claims per job before it is marked failed
+MAX_JOB_ATTEMPTS = int(os.environ.get("MAX_JOB_ATTEMPTS", 3))
+
+sql_create_jobs_table = """CREATE TABLE IF NOT EXISTS Jobs (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                pdf_path TEXT NOT NULL,
+                                content_hash TEXT,
+                                state TEXT NOT NULL DEFAULT 'queued',
+                                pdf_id INTEGER,
+                                pages_done INTEGER NOT NULL DEFAULT 0,
+                                pages_total INTEGER,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                lease_owner TEXT,
+                                lease_expires_at REAL,
+                                error TEXT,
+                                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                            );"""
+
+sql_create_jobs_indexes = [
+    """CREATE INDEX IF NOT EXISTS idx_jobs_state ON Jobs(state, id);""",
+    """CREATE INDEX IF NOT EXISTS idx_jobs_content_hash ON Jobs(content_hash);""",
+]
+
+_JOB_COLUMNS = ("id", "pdf_path", "content_hash", "state", "pdf_id", "pages_done", "pages_total",
+                "attempts", "lease_owner", "lease_expires_at", "error", "created_at", "updated_at")
+
+
+def create_jobs_table(conn):
+    conn.execute(sql_create_jobs_table)
+    for sql in sql_create_jobs_indexes:
+        conn.execute(sql)
+
+
+def enqueue_jobs(conn, items):
+    """
+    Queue PDFs for processing in one transaction.
+    :param conn: Database connection object.
+    :param items: Iterable of (pdf_path, content_hash) tuples.
+    :return: List of the new job ids, in input order.
+    """
+    job_ids = []
+    with conn:
+        for pdf_path, content_hash in items:
+            cur = conn.execute("INSERT INTO Jobs(pdf_path, content_hash) VALUES(?, ?)", (pdf_path, content_hash))
+            job_ids.append(cur.lastrowid)
+    return job_ids
+
+
+def queue_depth(conn):
+    """Number of jobs waiting or being worked on."""
+    return conn.execute("SELECT COUNT(*) FROM Jobs WHERE state IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)).fetchone()[0]
+
+
+def claim_job(conn, owner, lease_seconds=JOB_LEASE_SECONDS):
+    """
+    Lease the oldest claimable job: a queued one, or a running one whose lease has expired.
+    :param conn: Database connection object.
+    :param owner: Identifier of the claiming worker.
+    :param lease_seconds: How long the lease lasts before it must be extended with heartbeat_job.
+    :return: The claimed job as a dict, or None if nothing is claimable.
+    """
+    now = time.time()
+    if conn.in_transaction:
+        conn.commit()
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers cannot claim the same job
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""UPDATE Jobs SET state = ?, error = 'lease expired too many times', lease_owner = NULL,
+                               updated_at = CURRENT_TIMESTAMP
+                        WHERE state = ? AND lease_expires_at < ? AND attempts >= ?""",
+                     (JOB_FAILED, JOB_RUNNING, now, MAX_JOB_ATTEMPTS))
+        row = conn.execute("""SELECT id FROM Jobs
+                              WHERE state = ? OR (state = ? AND lease_expires_at < ?)
+                              ORDER BY id LIMIT 1""", (JOB_QUEUED, JOB_RUNNING, now)).fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        conn.execute("""UPDATE Jobs SET state = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1,
+                               updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ?""", (JOB_RUNNING, owner, now + lease_seconds, row[0]))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return fetch_job(conn, row[0])
+
+
+def heartbeat_job(conn, job_id, owner, lease_seconds=JOB_LEASE_SECONDS, pages_done=None, pages_total=None):
+    """
+    Extend a job's lease and record its progress.
+    :return: False if the lease was lost (expired and taken over by another worker).
+    """
+    with conn:
+        cur = conn.execute("""UPDATE Jobs SET lease_expires_at = ?, pages_done = COALESCE(?, pages_done),
+                                     pages_total = COALESCE(?, pages_total), updated_at = CURRENT_TIMESTAMP
+                              WHERE id = ? AND lease_owner = ? AND state = ?""",
+                           (time.time() + lease_seconds, pages_done, pages_total, job_id, owner, JOB_RUNNING))
+    return cur.rowcount == 1
+
+
+def complete_job(conn, job_id, owner, pdf_id):
+    with conn:
+        conn.execute("""UPDATE Jobs SET state = ?, pdf_id = ?, pages_done = COALESCE(pages_total, pages_done),
+                               lease_owner = NULL, lease_expires_at = NULL, error = NULL, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ? AND lease_owner = ?""", (JOB_DONE, pdf_id, job_id, owner))
+
+
+def fail_job(conn, job_id, owner, error):
+    """Put a failed job back in the queue, or mark it failed once it has used up its attempts."""
+    with conn:
+        conn.execute("""UPDATE Jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?,
+                               lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ? AND lease_owner = ?""",
+                     (MAX_JOB_ATTEMPTS, JOB_FAILED, JOB_QUEUED, error, job_id, owner))
+
+
+def fetch_job(conn, job_id):
+    row = conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM Jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(zip(_JOB_COLUMNS, row)) if row is not None else None
+
+
+def fetch_jobs(conn, job_ids):
+    """Return the jobs with the given ids, ordered by id; unknown ids are left out."""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return []
+    placeholders = ",".join("?" for _ in job_ids)
+    rows = conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM Jobs WHERE id IN ({placeholders}) ORDER BY id",
+                        job_ids).fetchall()
+    return [dict(zip(_JOB_COLUMNS, row)) for row in rows]
+
+
+def fetch_paths_by_hash(conn, content_hashes):
+    """
+    Find files already holding the given contents: the paths of earlier jobs, and the original paths of stored PDFs.
+    :param conn: Database connection object.
+    :param content_hashes: Iterable of SHA-256 hex digests.
+    :return: Dict mapping each hash that was found to its known paths, job paths first, newest first.
+    """
+    content_hashes = list(set(content_hashes))
+    if not content_hashes:
+        return {}
+    placeholders = ",".join("?" for _ in content_hashes)
+    rows = conn.execute(f"""SELECT content_hash, pdf_path FROM (
+                                SELECT content_hash, pdf_path, 1 AS source, id FROM Jobs
+                                WHERE content_hash IN ({placeholders})
+                                UNION ALL
+                                SELECT content_hash, original_path, 0 AS source, id FROM PDFs
+                                WHERE content_hash IN ({placeholders}))
+                            ORDER BY source DESC, id DESC""", content_hashes + content_hashes).fetchall()
+    paths = {}
+    for content_hash, path in rows:
+        if path not in paths.setdefault(content_hash, []):
+            paths[content_hash].append(path)
+    return paths
@@ -3,6 +3,14 @@ import sqlite3
 from sqlite3 import Error
 from typing import List, Dict, Any  # Depending on your usage
 import logging
+import os
+import time
+from database.connection import create_connection
+from database.generation import bump_generation, create_data_version_table
+from database.jobs import create_jobs_table
+from database.page_text import sql_create_page_texts_table, store_page_texts, attach_contexts
+from database.search import create_search_index, index_new_dates, unindex_pdf_dates
+from monitoring import metrics
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -19,6 +27,125 @@ def fetch_processed_data(conn):
     return data
     conn.close()
 
+def _dates_query(after_id=None, pdf_id=None, page_from=None, page_to=None, uploaded_after=None, uploaded_before=None):
+    """Build the filtered Dates query shared by pagination and export; rows come back ordered by id."""
+    sql = """SELECT d.id, d.pdf_id, d.date_text, d.context, d.page_number, d.start_char, d.end_char FROM Dates d"""
+    conditions = []
+    params = []
+    if uploaded_after is not None or uploaded_before is not None:
+        sql += " JOIN PDFs p ON p.id = d.pdf_id"
+        if uploaded_after is not None:
+            conditions.append("p.uploaded_at >= ?")
+            params.append(uploaded_after)
+        if uploaded_before is not None:
+            conditions.append("p.uploaded_at < ?")
+            params.append(uploaded_before)
+    if after_id is not None:
+        conditions.append("d.id > ?")
+        params.append(after_id)
+    if pdf_id is not None:
+        conditions.append("d.pdf_id = ?")
+        params.append(pdf_id)
+    if page_from is not None:
+        conditions.append("d.page_number >= ?")
+        params.append(page_from)
+    if page_to is not None:
+        conditions.append("d.page_number <= ?")
+        params.append(page_to)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY d.id"
+    return sql, params
+
+def fetch_dates_page(conn, limit, after_id=None, pdf_id=None, page_from=None, page_to=None,
+                     uploaded_after=None, uploaded_before=None, context_words=None):
+    """
+    Fetch one page of Dates rows using keyset pagination on Dates.id.
+    :param conn: Database connection object.
+    :param limit: Maximum number of rows to return.
+    :param after_id: Only return rows with an id greater than this (the previous page's last id).
+    :param pdf_id: Only return dates of this PDF.
+    :param page_from: Only return dates on this page number or later.
+    :param page_to: Only return dates on this page number or earlier.
+    :param uploaded_after: Only return dates of PDFs uploaded at or after this "YYYY-MM-DD HH:MM:SS" UTC time.
+    :param uploaded_before: Only return dates of PDFs uploaded before this "YYYY-MM-DD HH:MM:SS" UTC time.
+    :param context_words: Width of the returned contexts; see database.page_text.CONTEXT_WORDS.
+    :return: (rows as dicts, id to pass as after_id for the next page or None on the last page)
+    """
+    sql, params = _dates_query(after_id, pdf_id, page_from, page_to, uploaded_after, uploaded_before)
+    # One extra row tells us whether another page follows
+    sql += " LIMIT ?"
+    params.append(limit + 1)
+
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    columns = [col[0] for col in cur.description]
+    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    next_id = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_id = rows[-1]["id"]
+    return attach_contexts(conn, rows, context_words), next_id
+
+def iter_dates_chunks(conn, chunk_size, context_words=None, **filters):
+    """
+    Stream every Dates row matching the filters of fetch_dates_page, chunk_size rows at a time.
+    Each chunk is a separate keyset query, so no read snapshot stays open between chunks and WAL
+    checkpoints can proceed during a long export; rows committed meanwhile may be included.
+    :param conn: Database connection object.
+    :param chunk_size: Number of rows fetched per chunk.
+    :param context_words: Width of the returned contexts; see database.page_text.CONTEXT_WORDS.
+    :return: Iterator of lists of row dicts.
+    """
+    after_id = None
+    while True:
+        rows, after_id = fetch_dates_page(conn, chunk_size, after_id, context_words=context_words, **filters)
+        if rows:
+            yield rows
+        if after_id is None:
+            break
+
+def fetch_timeline_page(conn, limit, start_ordinal=None, end_ordinal=None, pdf_id=None, after=None, context_words=None):
+    """
+    Fetch dates ordered on the timeline, using keyset pagination on (date_start, id).
+    Only rows with a normalised value are returned.
+    :param conn: Database connection object.
+    :param limit: Maximum number of rows to return.
+    :param start_ordinal: Only return dates starting on or after this date ordinal.
+    :param end_ordinal: Only return dates starting on or before this date ordinal.
+    :param pdf_id: Only return dates of this PDF (a per-document timeline).
+    :param after: (date_start, id) of the previous page's last row.
+    :param context_words: Width of the returned contexts; see database.page_text.CONTEXT_WORDS.
+    :return: (rows as dicts, (date_start, id) to pass as after for the next page or None on the last page)
+    """
+    sql = """SELECT id, pdf_id, date_text, context, page_number, date_start, date_end, date_precision, start_char, end_char
+             FROM Dates WHERE date_start IS NOT NULL"""
+    params = []
+    if start_ordinal is not None:
+        sql += " AND date_start >= ?"
+        params.append(start_ordinal)
+    if end_ordinal is not None:
+        sql += " AND date_start <= ?"
+        params.append(end_ordinal)
+    if pdf_id is not None:
+        sql += " AND pdf_id = ?"
+        params.append(pdf_id)
+    if after is not None:
+        sql += " AND (date_start, id) > (?, ?)"
+        params.extend(after)
+    sql += " ORDER BY date_start, id LIMIT ?"
+    params.append(limit + 1)
+
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    columns = [col[0] for col in cur.description]
+    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1]["date_start"], rows[-1]["id"])
+    return attach_contexts(conn, rows, context_words), next_after
+
 def sync_fetch_processed_data(db_path):
     data = []
     conn = create_connection(db_path)
@@ -31,6 +158,30 @@ def initialize_database(conn: Connection):
     if conn is not None:
         create_table(conn, sql_create_pdfs_table)
         create_table(conn, sql_create_dates_table)
+        # Databases created before these columns existed are upgraded in place
+        ensure_column(conn, "PDFs", "content_hash", "TEXT")
+        ensure_column(conn, "PDFs", "extractor_version", "TEXT")
+        ensure_column(conn, "PDFs", "ocr_status", "TEXT")
+        ensure_column(conn, "PDFs", "ocr_error", "TEXT")
+        ensure_column(conn, "PDFs", "uploaded_at", "TEXT")
+        ensure_column(conn, "PDFs", "status", "TEXT")
+        ensure_column(conn, "PDFs", "page_count", "INTEGER")
+        ensure_column(conn, "PDFs", "lease_owner", "TEXT")
+        ensure_column(conn, "PDFs", "lease_expires_at", "REAL")
+        ensure_column(conn, "Dates", "date_start", "INTEGER")
+        ensure_column(conn, "Dates", "date_end", "INTEGER")
+        ensure_column(conn, "Dates", "date_precision", "TEXT")
+        ensure_column(conn, "Dates", "start_char", "INTEGER")
+        ensure_column(conn, "Dates", "end_char", "INTEGER")
+        create_table(conn, sql_create_processed_pages_table)
+        create_table(conn, sql_create_page_texts_table)
+        create_table(conn, sql_create_ingested_files_table)
+        create_data_version_table(conn)
+        for create_index_sql in sql_create_indexes:
+            create_table(conn, create_index_sql)
+        create_search_index(conn)
+        create_jobs_table(conn)
+        conn.commit()
     else:
         logger.info(f"Unable to establish a database connection.")
 
@@ -42,37 +193,108 @@ def create_table(conn, create_table_sql):
         c.execute(create_table_sql)
     except Error as e:
         print(e)
+def ensure_column(conn, table, column, column_definition):
+    """Add a column to an existing table if it is not there yet."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_definition}")
+
 sql_create_pdfs_table = """CREATE TABLE IF NOT EXISTS PDFs (
                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                                 original_path TEXT NOT NULL,
                                 ocr_path TEXT,
-                                processed BOOLEAN NOT NULL DEFAULT 0
+                                processed BOOLEAN NOT NULL DEFAULT 0,
+                                content_hash TEXT,
+                                extractor_version TEXT,
+                                ocr_status TEXT,
+                                ocr_error TEXT,
+                                uploaded_at TEXT,
+                                status TEXT,
+                                page_count INTEGER,
+                                lease_owner TEXT,
+                                lease_expires_at REAL
                             );"""
 
+# PDFs.status is PDF_IN_PROGRESS while a document is being checkpointed page by page;
+# NULL (rows written whole, or before the column existed) and PDF_COMPLETE both mean complete.
+PDF_IN_PROGRESS = "in_progress"
+PDF_COMPLETE = "complete"
+
+# An in-progress PDF is leased by the process filling it in, like a job (see database.jobs).
+# The process extends the lease while it works; once it expires another process may resume the PDF.
+PDF_LEASE_SECONDS = float(os.environ.get("PDF_LEASE_SECONDS", 60))
+
+
+class PdfLeaseLost(Exception):
+    """Raised when writing to an in-progress PDF whose lease has passed to another process."""
+
 sql_create_dates_table = """CREATE TABLE IF NOT EXISTS Dates (
                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                                 pdf_id INTEGER,
                                 date_text TEXT NOT NULL,
                                 context TEXT,
                                 page_number INTEGER,
+                                date_start INTEGER,
+                                date_end INTEGER,
+                                date_precision TEXT,
+                                start_char INTEGER,
+                                end_char INTEGER,
                                 FOREIGN KEY (pdf_id) REFERENCES PDFs(id) ON DELETE CASCADE
                             );"""
 
-def insert_pdf_data(conn, pdf_path, ocr_path, processed):
+# Files seen by bulk ingestion (pdf_processing.ingest); a file whose path, mtime and size match
+# a row here, under the current extractor version, is skipped without being read
+sql_create_ingested_files_table = """CREATE TABLE IF NOT EXISTS IngestedFiles (
+                                path TEXT PRIMARY KEY,
+                                mtime REAL NOT NULL,
+                                size INTEGER NOT NULL,
+                                content_hash TEXT NOT NULL,
+                                extractor_version TEXT,
+                                ingested_at TEXT
+                            );"""
+
+# Pages of in-progress PDFs whose dates are already committed
+sql_create_processed_pages_table = """CREATE TABLE IF NOT EXISTS ProcessedPages (
+                                pdf_id INTEGER NOT NULL,
+                                page_number INTEGER NOT NULL,
+                                PRIMARY KEY (pdf_id, page_number),
+                                FOREIGN KEY (pdf_id) REFERENCES PDFs(id) ON DELETE CASCADE
+                            ) WITHOUT ROWID;"""
+
+sql_create_indexes = [
+    """CREATE INDEX IF NOT EXISTS idx_pdfs_content_hash ON PDFs(content_hash);""",
+    """CREATE INDEX IF NOT EXISTS idx_pdfs_uploaded_at ON PDFs(uploaded_at);""",
+    """CREATE INDEX IF NOT EXISTS idx_pdfs_status ON PDFs(status);""",
+    # Secondary indexes end in the rowid, so this one also serves "pdf_id = ? AND id > ? ORDER BY id"
+    """CREATE INDEX IF NOT EXISTS idx_dates_pdf_id ON Dates(pdf_id);""",
+    """CREATE INDEX IF NOT EXISTS idx_dates_pdf_page ON Dates(pdf_id, page_number);""",
+    # Timeline queries: ordered by (date_start, id), across all PDFs or within one
+    """CREATE INDEX IF NOT EXISTS idx_dates_start ON Dates(date_start);""",
+    """CREATE INDEX IF NOT EXISTS idx_dates_pdf_start ON Dates(pdf_id, date_start);""",
+]
+
+def insert_pdf_data(conn, pdf_path, ocr_path, processed, content_hash=None, extractor_version=None,
+                    ocr_status=None, ocr_error=None):
     """
     Insert a new PDF entry into the database.
     :param conn: Database connection object.
     :param pdf_path: The path to the original PDF file.
     :param ocr_path: The path to the OCR-processed PDF file.
     :param processed: Boolean indicating whether the PDF was OCR processed.
+    :param content_hash: SHA-256 of the original file's bytes.
+    :param extractor_version: Version key of the extractor that produced the dates.
+    :param ocr_status: Outcome of OCR: not_needed, ok, failed, timeout or cancelled.
+    :param ocr_error: Error message when OCR did not succeed.
     :return: The id of the inserted PDF.
     """
-    sql = ''' INSERT INTO PDFs(original_path, ocr_path, processed)
-              VALUES(?,?,?) '''
+    sql = ''' INSERT INTO PDFs(original_path, ocr_path, processed, content_hash, extractor_version, ocr_status, ocr_error, uploaded_at)
+              VALUES(?,?,?,?,?,?,?,CURRENT_TIMESTAMP) '''
     cur = conn.cursor()
-    cur.execute(sql, (pdf_path, ocr_path, processed))
+    cur.execute(sql, (pdf_path, ocr_path, processed, content_hash, extractor_version, ocr_status, ocr_error))
+    pdf_id = cur.lastrowid
+    bump_generation(cur)
     conn.commit()
-    return cur.lastrowid
+    return pdf_id
 
 def insert_date_data(conn, pdf_id, date_text, context, page_number):
     """
@@ -87,4 +309,266 @@ def insert_date_data(conn, pdf_id, date_text, context, page_number):
               VALUES(?,?,?,?) '''
     cur = conn.cursor()
     cur.execute(sql, (pdf_id, date_text, context, page_number))
-    conn.commit()
\ No newline at end of file
+    index_new_dates(conn, pdf_id, cur.lastrowid - 1)
+    bump_generation(cur)
+    conn.commit()
+
+def find_pdfs_by_hash(conn, content_hash):
+    """
+    Look up PDFs already processed from a file with the given content.
+    :param conn: Database connection object.
+    :param content_hash: SHA-256 of the file's bytes.
+    :return: List of (pdf_id, extractor_version, ocr_status, status, lease_expires_at) tuples.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT id, extractor_version, ocr_status, status, lease_expires_at FROM PDFs WHERE content_hash = ?",
+                (content_hash,))
+    return cur.fetchall()
+
+def delete_pdf_data(conn, pdf_id):
+    """
+    Delete a PDF entry and all of its dates.
+    :param conn: Database connection object.
+    :param pdf_id: The id of the PDF from the PDFs table.
+    """
+    cur = conn.cursor()
+    _delete_pdfs(cur, [pdf_id])
+    bump_generation(cur)
+    conn.commit()
+
+@metrics.DB_SECONDS.time(operation="insert_pdf_with_dates")
+def insert_pdf_with_dates(conn, pdf_path, ocr_path, processed, dates, content_hash=None, extractor_version=None,
+                          ocr_status=None, ocr_error=None, replace_pdf_ids=(), page_texts=None):
+    """
+    Insert a PDF entry and all of its dates in a single transaction.
+    :param conn: Database connection object.
+    :param pdf_path: The path to the original PDF file.
+    :param ocr_path: The path to the OCR-processed PDF file.
+    :param processed: Boolean indicating whether the PDF was OCR processed.
+    :param dates: Iterable of dicts with "text", "context" and "page_number" keys, and optionally
+                  "date_start", "date_end" and "date_precision" (see pdf_processing.date_normalizer)
+                  and "start_char" and "end_char" (offsets into the page text).
+    :param content_hash: SHA-256 of the original file's bytes.
+    :param extractor_version: Version key of the extractor that produced the dates.
+    :param ocr_status: Outcome of OCR: not_needed, ok, failed, timeout or cancelled.
+    :param ocr_error: Error message when OCR did not succeed.
+    :param replace_pdf_ids: Ids of older PDF entries (and their dates) to delete in the same transaction.
+    :param page_texts: Text per page number. Dates with offsets on a page given here are stored
+                       without a context; the page text is stored once instead (see database.page_text).
+    :return: The id of the inserted PDF.
+    """
+    with conn:
+        cur = conn.cursor()
+        pdf_id = _insert_pdf_with_dates(cur, pdf_path, ocr_path, processed, dates, content_hash, extractor_version,
+                                        ocr_status, ocr_error, replace_pdf_ids, page_texts)
+        bump_generation(cur)
+    return pdf_id
+
+@metrics.DB_SECONDS.time(operation="insert_pdfs_with_dates")
+def insert_pdfs_with_dates(conn, pdfs, ingested_files=()):
+    """
+    Insert several PDF entries with their dates, and record the files they came from, in a single transaction.
+    :param conn: Database connection object.
+    :param pdfs: Iterable of dicts with the keyword arguments of insert_pdf_with_dates (except conn).
+    :param ingested_files: Iterable of dicts for record_ingested_files, committed together with the PDFs.
+    :return: List of the new PDF ids, in input order.
+    """
+    with conn:
+        cur = conn.cursor()
+        pdf_ids = [_insert_pdf_with_dates(cur, **pdf) for pdf in pdfs]
+        _record_ingested_files(cur, ingested_files)
+        if pdf_ids:
+            bump_generation(cur)
+    return pdf_ids
+
+def _insert_pdf_with_dates(cur, pdf_path, ocr_path, processed, dates, content_hash=None, extractor_version=None,
+                           ocr_status=None, ocr_error=None, replace_pdf_ids=(), page_texts=None):
+    cur.execute(''' INSERT INTO PDFs(original_path, ocr_path, processed, content_hash, extractor_version, ocr_status, ocr_error, uploaded_at)
+                    VALUES(?,?,?,?,?,?,?,CURRENT_TIMESTAMP) ''',
+                (pdf_path, ocr_path, processed, content_hash, extractor_version, ocr_status, ocr_error))
+    pdf_id = cur.lastrowid
+    _insert_dates(cur, pdf_id, dates, page_texts or {})
+    _delete_pdfs(cur, replace_pdf_ids)
+    return pdf_id
+
+def fetch_ingested_file(conn, path):
+    """
+    :return: Dict with mtime, size, content_hash and extractor_version recorded for a file by bulk
+             ingestion, or None if it was never ingested.
+    """
+    row = conn.execute("SELECT mtime, size, content_hash, extractor_version FROM IngestedFiles WHERE path = ?",
+                       (path,)).fetchone()
+    if row is None:
+        return None
+    return {"mtime": row[0], "size": row[1], "content_hash": row[2], "extractor_version": row[3]}
+
+def record_ingested_files(conn, files):
+    """
+    Remember files handled by bulk ingestion so unchanged files are skipped without hashing next time.
+    :param files: Iterable of dicts with path, mtime, size, content_hash and extractor_version.
+    """
+    with conn:
+        _record_ingested_files(conn.cursor(), files)
+
+def _record_ingested_files(cur, files):
+    cur.executemany(''' INSERT OR REPLACE INTO IngestedFiles(path, mtime, size, content_hash, extractor_version, ingested_at)
+                        VALUES(?,?,?,?,?,CURRENT_TIMESTAMP) ''',
+                    ((f["path"], f["mtime"], f["size"], f["content_hash"], f["extractor_version"]) for f in files))
+
+def _insert_dates(cur, pdf_id, dates, page_texts):
+    # Dates whose page text is stored keep only offsets; the others keep their context as before
+    rows = []
+    used_pages = {}
+    for date in dates:
+        page_number = date['page_number']
+        if date.get('start_char') is not None and page_number in page_texts:
+            used_pages[page_number] = page_texts[page_number]
+            context = None
+        else:
+            context = date['context']
+        rows.append((pdf_id, date['text'], context, page_number, date.get('date_start'), date.get('date_end'),
+                     date.get('date_precision'), date.get('start_char'), date.get('end_char')))
+    if not rows:
+        return
+    store_page_texts(cur, pdf_id, used_pages)
+    last_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM Dates").fetchone()[0]
+    cur.executemany(''' INSERT INTO Dates(pdf_id, date_text, context, page_number, date_start, date_end, date_precision,
+                                         start_char, end_char)
+                        VALUES(?,?,?,?,?,?,?,?,?) ''', rows)
+    index_new_dates(cur.connection, pdf_id, last_id)
+
+def _delete_pdfs(cur, pdf_ids):
+    now = time.time()
+    for pdf_id in pdf_ids:
+        # Checked in the writing transaction: an entry another process leased since the ids were
+        # gathered is still being filled in, and its owner replaces the older results itself
+        if cur.execute("SELECT 1 FROM PDFs WHERE id = ? AND status = ? AND lease_expires_at >= ?",
+                       (pdf_id, PDF_IN_PROGRESS, now)).fetchone() is not None:
+            continue
+        unindex_pdf_dates(cur.connection, pdf_id)
+        cur.execute("DELETE FROM Dates WHERE pdf_id = ?", (pdf_id,))
+        cur.execute("DELETE FROM PageTexts WHERE pdf_id = ?", (pdf_id,))
+        cur.execute("DELETE FROM ProcessedPages WHERE pdf_id = ?", (pdf_id,))
+        cur.execute("DELETE FROM PDFs WHERE id = ?", (pdf_id,))
+
+@metrics.DB_SECONDS.time(operation="claim_pdf")
+def claim_pdf(conn, pdf_path, content_hash, extractor_version, page_count, owner, lease_seconds=PDF_LEASE_SECONDS):
+    """
+    Lease the in-progress PDF entry for this content and version, or insert one if there is none,
+    so that only one process at a time fills it in (see store_page_results and finish_pdf).
+    :param owner: Identifier of the claiming process; the lease is kept with renew_pdf_lease.
+    :return: Dict with id, ocr_path, ocr_status, ocr_error and pages_done (set of page numbers
+             already stored; empty for a new entry), or None if another process holds the lease.
+    """
+    now = time.time()
+    if conn.in_transaction:
+        conn.commit()
+    # BEGIN IMMEDIATE takes the write lock up front, so two processes cannot claim the same entry
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("""SELECT id, ocr_path, ocr_status, ocr_error, lease_owner, lease_expires_at FROM PDFs
+                              WHERE content_hash = ? AND extractor_version = ? AND status = ?
+                              ORDER BY id DESC LIMIT 1""",
+                           (content_hash, extractor_version, PDF_IN_PROGRESS)).fetchone()
+        if row is not None and row[4] not in (None, owner) and (row[5] or 0) >= now:
+            conn.commit()
+            return None
+        cur = conn.cursor()
+        if row is None:
+            cur.execute(''' INSERT INTO PDFs(original_path, ocr_path, processed, content_hash, extractor_version, uploaded_at,
+                                             status, page_count, lease_owner, lease_expires_at)
+                            VALUES(?,?,0,?,?,CURRENT_TIMESTAMP,?,?,?,?) ''',
+                        (pdf_path, pdf_path, content_hash, extractor_version, PDF_IN_PROGRESS, page_count,
+                         owner, now + lease_seconds))
+            bump_generation(cur)
+            claimed = {"id": cur.lastrowid, "ocr_path": pdf_path, "ocr_status": None, "ocr_error": None,
+                       "pages_done": set()}
+        else:
+            cur.execute("UPDATE PDFs SET lease_owner = ?, lease_expires_at = ? WHERE id = ?",
+                        (owner, now + lease_seconds, row[0]))
+            pages = cur.execute("SELECT page_number FROM ProcessedPages WHERE pdf_id = ?", (row[0],)).fetchall()
+            claimed = {"id": row[0], "ocr_path": row[1], "ocr_status": row[2], "ocr_error": row[3],
+                       "pages_done": {page_number for page_number, in pages}}
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return claimed
+
+def renew_pdf_lease(conn, pdf_id, owner, lease_seconds=PDF_LEASE_SECONDS):
+    """
+    Extend the lease on an in-progress PDF.
+    :return: False if the lease was lost (expired and taken over by another process).
+    """
+    with conn:
+        cur = conn.execute("UPDATE PDFs SET lease_expires_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                           (time.time() + lease_seconds, pdf_id, owner, PDF_IN_PROGRESS))
+    return cur.rowcount == 1
+
+def release_pdf(conn, pdf_id, owner):
+    """Give up the lease on an in-progress PDF, so the next run resumes it without waiting for the lease to expire."""
+    with conn:
+        conn.execute("UPDATE PDFs SET lease_owner = NULL, lease_expires_at = NULL WHERE id = ? AND lease_owner = ?",
+                     (pdf_id, owner))
+
+def _check_lease(cur, pdf_id, owner, lease_seconds=PDF_LEASE_SECONDS):
+    # Extends the lease as part of the write, and fails the write if another process owns the PDF now
+    cur.execute("UPDATE PDFs SET lease_expires_at = ? WHERE id = ? AND lease_owner = ?",
+                (time.time() + lease_seconds, pdf_id, owner))
+    if cur.rowcount != 1:
+        raise PdfLeaseLost(f"PDF {pdf_id} is no longer leased by {owner}")
+
+@metrics.DB_SECONDS.time(operation="store_page_results")
+def store_page_results(conn, pdf_id, owner, page_results, ocr_path, processed, ocr_status=None, ocr_error=None):
+    """
+    Commit the dates of a range of finished pages together with their checkpoint, in one transaction.
+    The OCR fields are saved as well so a resumed run knows about pages OCRed before the interruption.
+    :param conn: Database connection object.
+    :param pdf_id: The id of an in-progress PDF.
+    :param owner: Holder of the PDF's lease (see claim_pdf).
+    :param page_results: List of (page_number, text, dates) tuples; pages without dates are included too.
+    :param ocr_path: The path to the OCR-processed PDF file.
+    :param processed: Boolean indicating whether OCR produced a new file.
+    :raises PdfLeaseLost: The lease passed to another process; nothing is written.
+    """
+    with conn:
+        cur = conn.cursor()
+        _check_lease(cur, pdf_id, owner)
+        _insert_dates(cur, pdf_id, [date for _, _, dates in page_results for date in dates],
+                      {page_number: text for page_number, text, _ in page_results})
+        cur.executemany("INSERT OR IGNORE INTO ProcessedPages(pdf_id, page_number) VALUES(?, ?)",
+                        ((pdf_id, page_number) for page_number, _, _ in page_results))
+        cur.execute("UPDATE PDFs SET ocr_path = ?, processed = ?, ocr_status = ?, ocr_error = ? WHERE id = ?",
+                    (ocr_path, processed, ocr_status, ocr_error, pdf_id))
+        bump_generation(cur)
+
+@metrics.DB_SECONDS.time(operation="finish_pdf")
+def finish_pdf(conn, pdf_id, owner, ocr_path, processed, ocr_status=None, ocr_error=None, replace_pdf_ids=()):
+    """
+    Mark a checkpointed PDF complete, drop its page checkpoints and replace older entries, in one transaction.
+    :raises PdfLeaseLost: The lease passed to another process; nothing is written.
+    """
+    with conn:
+        cur = conn.cursor()
+        _check_lease(cur, pdf_id, owner)
+        cur.execute("""UPDATE PDFs SET ocr_path = ?, processed = ?, ocr_status = ?, ocr_error = ?, status = ?,
+                                      lease_owner = NULL, lease_expires_at = NULL
+                       WHERE id = ?""",
+                    (ocr_path, processed, ocr_status, ocr_error, PDF_COMPLETE, pdf_id))
+        cur.execute("DELETE FROM ProcessedPages WHERE pdf_id = ?", (pdf_id,))
+        _delete_pdfs(cur, replace_pdf_ids)
+        bump_generation(cur)
+
+def fetch_in_progress_pdfs(conn):
+    """
+    List PDFs whose processing stopped part way.
+    :return: List of dicts with id, original_path, content_hash, extractor_version, page_count, lease_owner,
+             lease_expires_at and pages_done.
+    """
+    cur = conn.cursor()
+    cur.execute("""SELECT p.id, p.original_path, p.content_hash, p.extractor_version, p.page_count,
+                          p.lease_owner, p.lease_expires_at,
+                          (SELECT COUNT(*) FROM ProcessedPages pp WHERE pp.pdf_id = p.id) AS pages_done
+                   FROM PDFs p WHERE p.status = ? ORDER BY p.id""", (PDF_IN_PROGRESS,))
+    columns = [col[0] for col in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
@@ -0,0 +1,90 @@
+"""
+Compressed page texts, and date contexts built from them on read.
+
+A date row stores only the character offsets of the date within its page. The text of each
+page that holds at least one date is stored once, zlib-compressed, in PageTexts. Contexts
+are cut out of that text when rows are read, so the context width can change without
+re-running extraction. Rows written before this existed keep their stored context.
+"""
+import os
+import zlib
+from typing import Any, Dict, Iterable, List, Tuple
+
+from pdf_processing.text_index import WordIndex
+
+# Default number of words on each side of a date in contexts returned to clients
+CONTEXT_WORDS = int(os.environ.get("CONTEXT_WORDS", 50))
+
+# Width of the contexts the full-text index is built from. The index must be rebuilt
+# (python -m database.search) after changing it, so it is not read from the environment.
+INDEX_CONTEXT_WORDS = 50
+
+PAGE_TEXT_COMPRESSION_LEVEL = 6
+
+# Pages fetched per query when building contexts; keeps the bound parameters under SQLite's limit
+_FETCH_BATCH = 400
+
+sql_create_page_texts_table = """CREATE TABLE IF NOT EXISTS PageTexts (
+                                id INTEGER PRIMARY KEY,
+                                pdf_id INTEGER NOT NULL,
+                                page_number INTEGER NOT NULL,
+                                text BLOB NOT NULL,
+                                UNIQUE (pdf_id, page_number),
+                                FOREIGN KEY (pdf_id) REFERENCES PDFs(id) ON DELETE CASCADE
+                            );"""
+
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), PAGE_TEXT_COMPRESSION_LEVEL)
+
+
+def decompress_text(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+def store_page_texts(cur, pdf_id: int, page_texts: Dict[int, str]):
+    """Store page texts of a PDF; pages already stored are left as they are."""
+    cur.executemany("INSERT OR IGNORE INTO PageTexts(pdf_id, page_number, text) VALUES(?, ?, ?)",
+                    ((pdf_id, page_number, compress_text(text)) for page_number, text in page_texts.items()))
+
+
+def fetch_page_indexes(conn, keys: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], WordIndex]:
+    """
+    Load and decompress the given pages.
+    :param keys: (pdf_id, page_number) pairs.
+    :return: WordIndex per (pdf_id, page_number); pages without stored text are missing.
+    """
+    keys = list(keys)
+    indexes = {}
+    for i in range(0, len(keys), _FETCH_BATCH):
+        batch = keys[i:i + _FETCH_BATCH]
+        sql = ("SELECT pdf_id, page_number, text FROM PageTexts WHERE (pdf_id, page_number) IN (VALUES "
+               + ",".join("(?, ?)" for _ in batch) + ")")
+        for pdf_id, page_number, data in conn.execute(sql, [value for key in batch for value in key]):
+            indexes[(pdf_id, page_number)] = WordIndex(decompress_text(data))
+    return indexes
+
+
+def _needs_context(row: Dict[str, Any]) -> bool:
+    return row.get("context") is None and row.get("start_char") is not None
+
+
+def attach_contexts(conn, rows: List[Dict[str, Any]], context_words: int = None) -> List[Dict[str, Any]]:
+    """
+    Fill in the context of rows that only hold offsets, reading each page once.
+    The offset columns are removed from the rows.
+    :param conn: Database connection object.
+    :param rows: Row dicts with pdf_id, page_number, context, start_char and end_char.
+    :param context_words: Words on each side of the date; defaults to CONTEXT_WORDS.
+    :return: The same rows.
+    """
+    if context_words is None:
+        context_words = CONTEXT_WORDS
+    pages = fetch_page_indexes(conn, {(row["pdf_id"], row["page_number"]) for row in rows if _needs_context(row)})
+    for row in rows:
+        if _needs_context(row):
+            index = pages.get((row["pdf_id"], row["page_number"]))
+            row["context"] = index.context(row["start_char"], row["end_char"], context_words) if index else ""
+        row.pop("start_char", None)
+        row.pop("end_char", None)
+    return rows
@@ -0,0 +1,122 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Number of read-only connections kept open for the retrieval API
+READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", 8))
+
+# Read-only connections kept for streaming exports, apart from the request pool so that long
+# exports cannot take every connection the other endpoints need
+EXPORT_POOL_SIZE = int(os.environ.get("DB_EXPORT_POOL_SIZE", 2))
+
+# Seconds a request waits for a free connection before giving up
+READ_POOL_TIMEOUT = float(os.environ.get("DB_READ_POOL_TIMEOUT", 10))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free in time."""
+
+
+class ReadConnectionPool:
+    """
+    A bounded pool of long-lived, read-only SQLite connections shared by executor threads.
+    Connections are opened on demand up to `size`, checked with a cheap query when handed out,
+    and replaced if they turn out to be broken. The database should be in WAL mode (see
+    database.connection.WRITE_PRAGMAS) so these readers never block the writer.
+    """
+
+    def __init__(self, db_file: str, size: int = READ_POOL_SIZE, timeout: float = READ_POOL_TIMEOUT):
+        self.db_file = db_file
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"file:{os.path.abspath(self.db_file)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @staticmethod
+    def _healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        return self._connect()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(f"No database connection became free within {self.timeout}s")
+            if self._healthy(conn):
+                return conn
+            logger.warning(f"Replacing broken pooled connection to {self.db_file}.")
+            self._discard(conn)
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def check(self) -> bool:
+        """Return True if a connection can be borrowed and answers a query."""
+        try:
+            with self.connection() as conn:
+                return self._healthy(conn)
+        except (sqlite3.Error, PoolTimeout):
+            return False
+
+    def close(self):
+        """Close idle connections now; connections still in use are closed when they are returned."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
@@ -0,0 +1,194 @@
+"""
+Full-text search over the context snippets of extracted dates.
+
+DatesFTS is a contentless FTS5 index: it stores only the index, not the text. Most date rows
+keep only offsets into their page's stored text (see database.page_text), so there is no
+context column for an external-content index or triggers to read from. Instead the write
+functions in database.operations index new rows, and unindex deleted ones, in the same
+transaction. The indexed text is each row's context INDEX_CONTEXT_WORDS words wide.
+
+Usage: python -m database.search path/to/database.db
+rebuilds the index from scratch, e.g. after changing INDEX_CONTEXT_WORDS.
+"""
+import argparse
+import logging
+import re
+import sqlite3
+
+from database.connection import create_write_connection
+from database.generation import bump_generation
+from database.page_text import INDEX_CONTEXT_WORDS, attach_contexts
+
+logger = logging.getLogger(__name__)
+
+sql_create_fts = """CREATE VIRTUAL TABLE IF NOT EXISTS DatesFTS USING fts5(context, content='');"""
+
+# Triggers of the earlier external-content index, dropped when upgrading
+_legacy_triggers = ("dates_fts_insert", "dates_fts_delete", "dates_fts_update")
+
+# Rows read per batch when (re)building the index
+_INDEX_BATCH = 2000
+
+_INDEXED_COLUMNS = "id, pdf_id, page_number, context, start_char, end_char"
+
+_word_regex = re.compile(r"\w+")
+
+
+def _fts_sql(conn):
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'DatesFTS'").fetchone()
+    return row[0] if row else None
+
+
+def create_search_index(conn):
+    """
+    Create the FTS5 index if missing, replacing the external-content index of older databases.
+    A newly created index is filled from the existing Dates rows. Does nothing (but log) if
+    SQLite was built without FTS5.
+    """
+    existing = _fts_sql(conn)
+    if existing is not None and "content=''" not in existing:
+        for trigger in _legacy_triggers:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute("DROP TABLE DatesFTS")
+        existing = None
+    try:
+        conn.execute(sql_create_fts)
+    except sqlite3.OperationalError as e:
+        logger.error(f"Full-text search is unavailable: {e}")
+        return
+    if existing is None:
+        rebuild_search_index(conn)
+
+
+def _index_rows(conn, rows, command=None):
+    """Add rows to (or, with command='delete', remove them from) the index."""
+    rows = attach_contexts(conn, rows, INDEX_CONTEXT_WORDS)
+    if command is None:
+        conn.executemany("INSERT INTO DatesFTS(rowid, context) VALUES (?, ?)",
+                         ((row["id"], row["context"]) for row in rows))
+    else:
+        conn.executemany("INSERT INTO DatesFTS(DatesFTS, rowid, context) VALUES (?, ?, ?)",
+                         ((command, row["id"], row["context"]) for row in rows))
+
+
+def _select_rows(conn, where, params):
+    cur = conn.execute(f"SELECT {_INDEXED_COLUMNS} FROM Dates WHERE {where}", params)
+    columns = [col[0] for col in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def index_new_dates(conn, pdf_id, after_id):
+    """
+    Index the dates of a PDF with an id greater than after_id; call inside the inserting transaction,
+    after the rows and their page texts are written.
+    """
+    if _fts_sql(conn) is None:
+        return
+    _index_rows(conn, _select_rows(conn, "pdf_id = ? AND id > ?", (pdf_id, after_id)))
+
+
+def unindex_pdf_dates(conn, pdf_id):
+    """Remove the dates of a PDF from the index; call before the rows and their page texts are deleted."""
+    if _fts_sql(conn) is None:
+        return
+    _index_rows(conn, _select_rows(conn, "pdf_id = ?", (pdf_id,)), command="delete")
+
+
+def rebuild_search_index(conn):
+    """Rebuild the FTS5 index from the Dates table and merge its segments."""
+    with conn:
+        conn.execute("INSERT INTO DatesFTS(DatesFTS) VALUES ('delete-all')")
+        after_id = 0
+        while True:
+            rows = _select_rows(conn, f"id > ? ORDER BY id LIMIT {_INDEX_BATCH}", (after_id,))
+            if not rows:
+                break
+            after_id = rows[-1]["id"]
+            _index_rows(conn, rows)
+        conn.execute("INSERT INTO DatesFTS(DatesFTS) VALUES ('optimize')")
+        bump_generation(conn.cursor())
+
+
+def to_match_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching rows that contain every word, ignoring FTS5 syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def make_snippet(text: str, query: str, size: int = 16) -> str:
+    """
+    Cut a window of about size words around the first query match and mark matches with [ ],
+    like FTS5's snippet(), which is unavailable on a contentless index.
+    """
+    terms = {term.lower() for term in _word_regex.findall(query)}
+    words = list(_word_regex.finditer(text))
+    if not words:
+        return text
+    hits = [i for i, word in enumerate(words) if word.group().lower() in terms]
+    first = hits[0] if hits else 0
+    lo = max(0, min(first - size // 4, len(words) - size))
+    hi = min(len(words), lo + size)
+    parts = []
+    position = words[lo].start()
+    for i in range(lo, hi):
+        word = words[i]
+        parts.append(text[position:word.start()])
+        parts.append(f"[{word.group()}]" if i in hits else word.group())
+        position = word.end()
+    return ("..." if lo > 0 else "") + "".join(parts) + ("..." if hi < len(words) else "")
+
+
+def search_dates(conn, query, limit, offset=0, pdf_id=None, start_ordinal=None, end_ordinal=None, context_words=None):
+    """
+    Search date contexts, best matches first.
+    :param conn: Database connection object.
+    :param query: Free text; every word must appear in the context.
+    :param limit: Maximum number of rows to return.
+    :param offset: Number of ranked rows to skip.
+    :param pdf_id: Only return dates of this PDF.
+    :param start_ordinal: Only return dates whose normalised value starts on or after this ordinal.
+    :param end_ordinal: Only return dates whose normalised value starts on or before this ordinal.
+    :param context_words: Width of the returned contexts; see database.page_text.CONTEXT_WORDS.
+    :return: List of row dicts with the Dates columns plus "rank" (bm25, lower is better) and "snippet".
+    """
+    sql = """SELECT d.id, d.pdf_id, d.date_text, d.context, d.page_number,
+                    d.date_start, d.date_end, d.date_precision, d.start_char, d.end_char,
+                    bm25(DatesFTS) AS rank
+             FROM DatesFTS JOIN Dates d ON d.id = DatesFTS.rowid
+             WHERE DatesFTS MATCH ?"""
+    params = [to_match_query(query)]
+    if pdf_id is not None:
+        sql += " AND d.pdf_id = ?"
+        params.append(pdf_id)
+    if start_ordinal is not None:
+        sql += " AND d.date_start >= ?"
+        params.append(start_ordinal)
+    if end_ordinal is not None:
+        sql += " AND d.date_start <= ?"
+        params.append(end_ordinal)
+    sql += " ORDER BY rank LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    columns = [col[0] for col in cur.description]
+    rows = attach_contexts(conn, [dict(zip(columns, row)) for row in cur.fetchall()], context_words)
+    for row in rows:
+        row["snippet"] = make_snippet(row["context"], query)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the full-text index over date contexts.")
+    parser.add_argument("db_path", help="Path to the SQLite database file")
+    args = parser.parse_args()
+    # Imported here: database.operations imports this module
+    from database.operations import initialize_database
+    conn = create_write_connection(args.db_path)
+    initialize_database(conn)
+    rebuild_search_index(conn)
+    conn.close()
+    print("Full-text index rebuilt.")
+
+
+if __name__ == '__main__':
+    main()
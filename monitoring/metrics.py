@@ -0,0 +1,297 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters and histograms live in a registry. Recording a value takes a lock and a few
+dictionary operations, cheap enough to leave on in production. Set METRICS_ENABLED=0 to
+turn recording off entirely.
+
+PDFs are processed in queue worker processes and pool workers, not in the API process.
+Each process therefore writes its snapshot to METRICS_DIR with flush(), named by its PID
+and start time. render() then adds up its own registry and the snapshots of every other process.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+# Directory where each process publishes its metrics snapshot for the /metrics route
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join("data", "metrics"))
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        # A new lock too: a forked child may inherit this one held by a thread that does not exist there
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED or not amount:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: [per-bucket counts (non-cumulative, last one is +Inf), sum, count]
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        """Time a block or function and observe its duration: `with histogram.time(stage="ner"):`."""
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(series[0]), series[1], series[2]]] for key, series in self.values.items()]
+
+
+class _Timer(ContextDecorator):
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self._starts = threading.local()
+
+    def __enter__(self):
+        # A stack per thread, so one timer object can decorate a re-entrant or shared function
+        starts = getattr(self._starts, "stack", None)
+        if starts is None:
+            starts = self._starts.stack = []
+        starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._starts.stack.pop(), **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, list]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+# A forked pool worker starts with a copy of its parent's values; without this, its snapshot
+# would report the parent's counts a second time
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=REGISTRY.reset)
+
+PAGES = REGISTRY.register(Counter("pdf_pages_total", "Pages read from PDFs."))
+PAGES_SKIPPED = REGISTRY.register(Counter("pdf_pages_skipped_total", "Pages the date pre-filter kept away from NER."))
+PAGES_OCR = REGISTRY.register(Counter("pdf_pages_ocr_total", "Pages sent to OCR."))
+DATES = REGISTRY.register(Counter("pdf_dates_total", "Dates extracted."))
+DOCUMENTS = REGISTRY.register(Counter("pdf_documents_total", "PDFs processed, by outcome.", ("outcome",)))
+OCR_RUNS = REGISTRY.register(Counter("pdf_ocr_runs_total", "OCR invocations, by final status.", ("status",)))
+STAGE_SECONDS = REGISTRY.register(Histogram("pdf_stage_seconds", "Time spent in each processing stage.", ("stage",)))
+DOCUMENT_SECONDS = REGISTRY.register(Histogram("pdf_document_seconds", "Time to process one PDF end to end."))
+DB_SECONDS = REGISTRY.register(Histogram("db_operation_seconds", "Time spent in database write operations.", ("operation",)))
+RESPONSE_CACHE = REGISTRY.register(Counter("api_response_cache_total", "Retrieval requests by cache result: hit, miss or not_modified.",
+                                           ("result",)))
+
+
+# Start time of this module's process when /proc cannot tell it; see _start_time
+_IMPORTED_AT = str(int(time.time() * 1000))
+
+
+def _start_time(pid: int) -> Optional[str]:
+    """
+    Start time of a process in clock ticks since boot, from /proc; None if it cannot be read
+    (no such process, or no /proc on this platform).
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 22; the command name in field 2 may contain spaces and parentheses
+    return stat[stat.rindex(")") + 2:].split()[19]
+
+
+def _snapshot_name(pid: int) -> str:
+    # The start time tells a process apart from a later one that reuses its PID
+    return f"{pid}-{_start_time(pid) or _IMPORTED_AT}.json"
+
+
+def _process_alive(pid: int, start_time: str) -> bool:
+    """Whether the process that wrote a snapshot is still running; when unsure, assume it is."""
+    current = _start_time(pid)
+    if current is not None:
+        return current == start_time
+    if os.path.isdir("/proc"):
+        return False
+    if os.name != "posix":
+        # os.kill(pid, 0) would send CTRL_C_EVENT on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def flush():
+    """Publish this process's metrics for render() in other processes. Called after each PDF."""
+    if not METRICS_ENABLED:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, _snapshot_name(os.getpid()))
+        with open(path + ".tmp", "w") as f:
+            json.dump(REGISTRY.snapshot(), f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.warning(f"Cannot write metrics snapshot to {METRICS_DIR}: {e}")
+
+
+def reset_snapshots():
+    """
+    Delete the snapshots of processes that are no longer running; the API calls this on startup.
+    Snapshots of live processes, e.g. queue workers serving another API process, are kept.
+    """
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        base = name[:-len(".tmp")] if name.endswith(".tmp") else name
+        if not base.endswith(".json"):
+            continue
+        pid, _, start_time = base[:-len(".json")].partition("-")
+        # Snapshots named by PID only come from before start times were recorded
+        if pid.isdigit() and start_time and _process_alive(int(pid), start_time):
+            continue
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            pass
+
+
+def _load_snapshots() -> Iterable[Dict[str, list]]:
+    yield REGISTRY.snapshot()
+    if not os.path.isdir(METRICS_DIR):
+        return
+    own = _snapshot_name(os.getpid())
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json") or name == own:
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            continue
+
+
+def _merge(snapshots: Iterable[Dict[str, list]]) -> Dict[str, dict]:
+    merged = {name: {} for name in REGISTRY.metrics}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            metric = REGISTRY.metrics.get(name)
+            if metric is None:
+                continue
+            for key, value in series:
+                key = tuple(key)
+                current = merged[name].get(key)
+                if metric.kind == "counter":
+                    merged[name][key] = (current or 0) + value
+                elif current is None:
+                    merged[name][key] = [list(value[0]), value[1], value[2]]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+    return merged
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(name, value) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def render() -> str:
+    """Render the metrics of every process in the Prometheus text exposition format."""
+    merged = _merge(_load_snapshots())
+    lines: List[str] = []
+    for name, metric in REGISTRY.metrics.items():
+        lines.append(f"# HELP {name} {metric.help_text}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(merged[name].items()):
+            if metric.kind == "counter":
+                lines.append(f"{name}{_format_labels(metric.labels, key)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(metric.labels, key, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(metric.labels, key)} {total}")
+            lines.append(f"{name}_count{_format_labels(metric.labels, key)} {count}")
+    return "\n".join(lines) + "\n"
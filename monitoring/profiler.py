@@ -0,0 +1,91 @@
+"""
+Optional sampling profiler for finding out where a single slow document spends its time.
+
+Usage: python -m monitoring.profiler some.pdf [--out some.stacks] [--interval 0.005]
+
+A background thread samples the stack of the profiled thread at a fixed interval and counts
+identical stacks. The output is in the collapsed format ("frame;frame;frame count" per line)
+read by flamegraph.pl and speedscope. Nothing is sampled unless a profiler is running.
+
+Queue workers profile every job when PDF_PROFILE_DIR is set. They keep the stacks of jobs
+that take longer than PDF_PROFILE_MIN_SECONDS.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Directory for the stacks of slow queue jobs; profiling is off when unset
+PROFILE_DIR = os.environ.get("PDF_PROFILE_DIR")
+PROFILE_MIN_SECONDS = float(os.environ.get("PDF_PROFILE_MIN_SECONDS", 30))
+
+DEFAULT_INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    """Sample the calling thread's stack while the `with` block runs."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.seconds = 0.0
+        self._thread_id = None
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._start = None
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._stop_event.clear()
+        self._sampler = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._start = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop_event.set()
+        self._sampler.join()
+        self.seconds = time.perf_counter() - self._start
+        return False
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the extraction of one PDF and write collapsed stacks.")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--out", help="Output file; defaults to the PDF name with a .stacks suffix")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between samples")
+    args = parser.parse_args()
+
+    from pdf_processing.processor import _extract_pdf
+    with SamplingProfiler(args.interval) as profiler:
+        result = _extract_pdf(args.pdf_path)
+    out = args.out or os.path.splitext(os.path.basename(args.pdf_path))[0] + ".stacks"
+    profiler.write(out)
+    print(f"{len(result['dates'])} date(s) in {profiler.seconds:.2f}s; {profiler.samples} samples written to {out}")
+
+
+if __name__ == '__main__':
+    main()
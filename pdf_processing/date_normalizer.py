@@ -0,0 +1,172 @@
+"""
+Turn extracted date strings into sortable ranges.
+
+A date is stored as (start, end, precision): start and end are proleptic Gregorian ordinals
+(datetime.date.toordinal) of the first and last day the text can refer to, and precision is
+"day", "month", "year" or "decade". Text that does not pin down a year ("March 3", "next week")
+is not normalised.
+
+Usage: python -m pdf_processing.date_normalizer path/to/database.db
+fills in the normalised values of rows written before they existed.
+"""
+import argparse
+import calendar
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from database.connection import create_write_connection
+from database.generation import bump_generation
+from database.operations import initialize_database
+
+_MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august",
+           "september", "october", "november", "december"]
+
+_numeric_date_regex = re.compile(r"\b(\d{1,4})[-/.](\d{1,2})[-/.](\d{1,4})\b")
+_word_regex = re.compile(r"[a-z]+|\d+")
+_decade_regex = re.compile(r"\b(\d{3}0)'?s\b")
+_year_regex = re.compile(r"\b(\d{4})\b")
+
+# Two-digit years below this are read as 20xx, the rest as 19xx
+TWO_DIGIT_YEAR_PIVOT = 50
+
+MIN_YEAR = 1000
+MAX_YEAR = 2999
+
+
+def _month_number(word: str) -> Optional[int]:
+    if len(word) < 3:
+        return None
+    for index, name in enumerate(_MONTHS):
+        if name.startswith(word):
+            return index + 1
+    return None
+
+
+def _full_year(value: str) -> int:
+    year = int(value)
+    if len(value) <= 2:
+        year += 2000 if year < TWO_DIGIT_YEAR_PIVOT else 1900
+    return year
+
+
+def _day_range(year: int, month: int, day: int) -> Optional[Tuple[int, int, str]]:
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        return None
+    try:
+        ordinal = date(year, month, day).toordinal()
+    except ValueError:
+        return None
+    return ordinal, ordinal, "day"
+
+
+def _month_range(year: int, month: int) -> Optional[Tuple[int, int, str]]:
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        return None
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, 1).toordinal(), date(year, month, last_day).toordinal(), "month"
+
+
+def _numeric_date(first: str, second: str, third: str) -> Optional[Tuple[int, int, str]]:
+    if len(first) == 4:
+        # 2021-03-04
+        return _day_range(int(first), int(second), int(third))
+    a, b = int(first), int(second)
+    if a > 12:
+        # 31/12/2021 can only be day-first
+        a, b = b, a
+    # Otherwise month-first (12/04/2021 is December 4th)
+    return _day_range(_full_year(third), a, b)
+
+
+@lru_cache(maxsize=65536)
+def normalize_date(text: str) -> Optional[Tuple[int, int, str]]:
+    """
+    Normalise one extracted date string. Results are cached, since the same surface forms
+    ("January 1, 2020", "2019") repeat across pages and documents.
+    :param text: The date text as extracted.
+    :return: (start_ordinal, end_ordinal, precision), or None if the text cannot be placed on a timeline.
+    """
+    lowered = text.lower()
+
+    match = _numeric_date_regex.search(lowered)
+    if match:
+        return _numeric_date(*match.groups())
+
+    month = None
+    day = None
+    year = None
+    for word in _word_regex.findall(lowered):
+        if word.isdigit():
+            if len(word) == 4 and year is None:
+                year = int(word)
+            elif len(word) <= 2 and day is None and 1 <= int(word) <= 31:
+                day = int(word)
+        elif month is None:
+            month = _month_number(word)
+
+    if month is not None and year is not None:
+        if day is not None:
+            return _day_range(year, month, day)
+        return _month_range(year, month)
+    if month is not None:
+        return None
+
+    match = _decade_regex.search(lowered)
+    if match:
+        start_year = int(match.group(1))
+        if MIN_YEAR <= start_year <= MAX_YEAR - 9:
+            return date(start_year, 1, 1).toordinal(), date(start_year + 9, 12, 31).toordinal(), "decade"
+        return None
+
+    match = _year_regex.search(lowered)
+    if match:
+        year = int(match.group(1))
+        if MIN_YEAR <= year <= MAX_YEAR:
+            return date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal(), "year"
+    return None
+
+
+def backfill_normalized_dates(conn, batch_size: int = 5000) -> int:
+    """
+    Normalise Dates rows that have no normalised value yet.
+    :param conn: Database connection object.
+    :param batch_size: Rows updated per transaction.
+    :return: Number of rows that received a value.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute("SELECT id, date_text FROM Dates WHERE id > ? AND date_precision IS NULL ORDER BY id LIMIT ?",
+                            (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        values = []
+        for date_id, date_text in rows:
+            normalized = normalize_date(date_text)
+            if normalized is not None:
+                values.append(normalized + (date_id,))
+        with conn:
+            cur = conn.cursor()
+            cur.executemany("UPDATE Dates SET date_start = ?, date_end = ?, date_precision = ? WHERE id = ?", values)
+            if values:
+                # Date filters and sorting read these columns, so cached responses must be invalidated
+                bump_generation(cur)
+        updated += len(values)
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill in normalised date values for existing Dates rows.")
+    parser.add_argument("db_path", help="Path to the SQLite database file")
+    args = parser.parse_args()
+    conn = create_write_connection(args.db_path)
+    initialize_database(conn)
+    print(f"Normalised {backfill_normalized_dates(conn)} date(s).")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+import hashlib
+
+# Files are hashed in chunks of this many bytes so large scans never sit in memory at once
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 digest of a file's contents."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
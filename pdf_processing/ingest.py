@@ -0,0 +1,279 @@
+"""
+Bulk ingestion of PDF directory trees, for backfilling archives without the upload endpoint.
+
+Usage: python -m pdf_processing.ingest DIR [DIR ...] [--db data/my_project_database.db]
+                                       [--workers 4] [--in-flight 8] [--batch-size 50]
+
+Directories are walked lazily. A file whose path, mtime and size were recorded by an earlier
+run, under the current extractor version, is skipped without being read. Any other file is
+hashed in a worker process. If its content was already processed, it is only recorded.
+Otherwise it is extracted there. At most --in-flight files are queued or running at once.
+Only this process writes to SQLite: results are committed --batch-size PDFs per
+transaction, together with the IngestedFiles rows of the files they came from.
+Interrupting the run (Ctrl+C or SIGTERM) commits the finished results; running it again
+picks up where it stopped.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from database.connection import DEFAULT_DB_PATH, create_connection, create_write_connection
+from database.operations import fetch_ingested_file, initialize_database, insert_pdfs_with_dates
+from monitoring import metrics
+from pdf_processing.hashing import file_sha256
+from pdf_processing.ner import get_client, get_nlp
+from pdf_processing.ocr import OCR_MAX_JOBS
+from pdf_processing.processor import (DEFAULT_WORKERS, EXTRACTOR_VERSION, _check_cache, _extract_pdf, _init_worker)
+
+logger = logging.getLogger(__name__)
+
+# PDFs committed per transaction, and the longest a finished result waits for its commit
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 50))
+INGEST_COMMIT_SECONDS = float(os.environ.get("INGEST_COMMIT_SECONDS", 30))
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = float(os.environ.get("INGEST_PROGRESS_INTERVAL", 10))
+
+# Read connection of a pool worker, for the cache check; opened on first use
+_worker_conn = None
+
+
+def iter_pdf_files(roots: Iterable[str]) -> Iterator[str]:
+    """Yield the PDF files under the given directories (or the files themselves), one directory at a time."""
+    for root in roots:
+        if os.path.isfile(root):
+            yield os.path.abspath(root)
+            continue
+        stack = [os.path.abspath(root)]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+            except OSError as e:
+                logger.error(f"Cannot list directory '{directory}': {e}")
+                continue
+            subdirectories = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                    yield entry.path
+            # Reversed so the stack visits subdirectories in name order
+            stack.extend(reversed(subdirectories))
+
+
+def _count_pdf_files(roots: List[str], counts: Counter):
+    # Runs next to the ingestion so an ETA can be given once the trees are counted
+    counts["total"] = sum(1 for _ in iter_pdf_files(roots))
+
+
+def _ingest_file(pdf_path: str, db_path: str) -> Dict:
+    """Pool task: hash a file and extract it unless its content was already processed."""
+    global _worker_conn
+    content_hash = file_sha256(pdf_path)
+    if _worker_conn is None:
+        _worker_conn = create_connection(db_path)
+    cached_pdf_id, _ = _check_cache(_worker_conn, content_hash, leased_is_cached=True)
+    if cached_pdf_id is not None:
+        return {"pdf_path": pdf_path, "content_hash": content_hash, "cached": True}
+    result = _extract_pdf(pdf_path)
+    result.update(content_hash=content_hash, cached=False)
+    return result
+
+
+class _Progress:
+    def __init__(self, counts: Counter):
+        self.counts = counts
+        self.start = time.monotonic()
+        self.last_report = self.start
+
+    def report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        c = self.counts
+        elapsed = max(now - self.start, 1e-9)
+        rate = c["processed"] / elapsed
+        message = (f"{c['seen']} file(s) seen: {c['processed']} processed, {c['skipped']} unchanged, "
+                   f"{c['cached']} duplicate content, {c['failed']} failed; {c['pages']} pages, {c['dates']} dates; "
+                   f"{rate:.2f} files/s, {c['pages'] / elapsed:.1f} pages/s")
+        if c["total"] and rate > 0:
+            remaining = max(c["total"] - c["seen"], 0)
+            message += f"; {c['total']} total, ETA {_format_duration(remaining / rate)}"
+        logger.info(message)
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m{seconds % 60:02d}s"
+
+
+class _Writer:
+    """Collects finished results and commits them in batches."""
+
+    def __init__(self, conn, counts: Counter, batch_size: int):
+        self.conn = conn
+        self.counts = counts
+        self.batch_size = batch_size
+        self.pdfs = []
+        self.files = []
+        self.pending_hashes = set()
+        self.oldest = None
+
+    def add(self, result: Dict, stat: os.stat_result):
+        content_hash = result["content_hash"]
+        file_row = {"path": result["pdf_path"], "mtime": stat.st_mtime, "size": stat.st_size,
+                    "content_hash": content_hash, "extractor_version": EXTRACTOR_VERSION}
+        # Checked again here: identical files can finish in the same run, in or out of the pending batch
+        if not result["cached"] and content_hash not in self.pending_hashes:
+            cached_pdf_id, stale_pdf_ids = _check_cache(self.conn, content_hash, leased_is_cached=True)
+            if cached_pdf_id is None:
+                ocr_path = result["ocr_path"]
+                self.pdfs.append({"pdf_path": result["pdf_path"], "ocr_path": ocr_path,
+                                  "processed": ocr_path != result["pdf_path"], "dates": result["dates"],
+                                  "content_hash": content_hash, "extractor_version": EXTRACTOR_VERSION,
+                                  "ocr_status": result["ocr_status"], "ocr_error": result["ocr_error"],
+                                  "replace_pdf_ids": stale_pdf_ids, "page_texts": result["page_texts"]})
+                self.pending_hashes.add(content_hash)
+                self.counts["processed"] += 1
+                self.counts["pages"] += result["stats"]["pages"]
+                self.counts["dates"] += len(result["dates"])
+            else:
+                self._count_cached()
+        else:
+            self._count_cached()
+        self.files.append(file_row)
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        if len(self.pdfs) >= self.batch_size or len(self.files) >= self.batch_size * 20:
+            self.commit()
+
+    def _count_cached(self):
+        self.counts["cached"] += 1
+        metrics.DOCUMENTS.inc(outcome="cached")
+
+    def commit_if_due(self):
+        if self.oldest is not None and time.monotonic() - self.oldest >= INGEST_COMMIT_SECONDS:
+            self.commit()
+
+    def commit(self):
+        if not self.files:
+            return
+        insert_pdfs_with_dates(self.conn, self.pdfs, self.files)
+        self.pdfs = []
+        self.files = []
+        self.pending_hashes = set()
+        self.oldest = None
+
+
+def _start_pool(workers: int) -> ProcessPoolExecutor:
+    # As in process_and_store_pdfs: forked workers share a model loaded here
+    if get_client() is None and multiprocessing.get_start_method() == "fork":
+        get_nlp()
+    ocr_slots = multiprocessing.BoundedSemaphore(OCR_MAX_JOBS)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ocr_slots,))
+
+
+def ingest(roots: List[str], db_path: str = DEFAULT_DB_PATH, workers: Optional[int] = None,
+           in_flight: Optional[int] = None, batch_size: int = INGEST_BATCH_SIZE, count: bool = True) -> Counter:
+    """
+    Ingest every PDF under the given directories.
+    :param roots: Directories (or single files) to ingest.
+    :param db_path: Path to the SQLite database file.
+    :param workers: Worker processes; defaults to PDF_WORKERS or the CPU count.
+    :param in_flight: Most files queued or running at once; defaults to twice the workers.
+    :param batch_size: PDFs committed per transaction.
+    :param count: Count the files in a background thread so progress reports include an ETA.
+    :return: Counter with seen, processed, skipped, cached, failed, pages and dates.
+    """
+    workers = workers or DEFAULT_WORKERS
+    in_flight = in_flight or workers * 2
+    counts = Counter()
+    if count:
+        threading.Thread(target=_count_pdf_files, args=(roots, counts), daemon=True).start()
+    progress = _Progress(counts)
+
+    conn = create_write_connection(db_path)
+    initialize_database(conn)
+    writer = _Writer(conn, counts, batch_size)
+    # Started with the first file that needs reading, so a run where nothing changed loads no model
+    executor = None
+    futures = {}
+    files = iter_pdf_files(roots)
+    try:
+        exhausted = False
+        while futures or not exhausted:
+            while not exhausted and len(futures) < in_flight:
+                pdf_path = next(files, None)
+                if pdf_path is None:
+                    exhausted = True
+                    break
+                counts["seen"] += 1
+                try:
+                    stat = os.stat(pdf_path)
+                except OSError as e:
+                    logger.error(f"Cannot read '{pdf_path}': {e}")
+                    counts["failed"] += 1
+                    continue
+                recorded = fetch_ingested_file(conn, pdf_path)
+                if (recorded is not None and recorded["mtime"] == stat.st_mtime and recorded["size"] == stat.st_size
+                        and recorded["extractor_version"] == EXTRACTOR_VERSION):
+                    counts["skipped"] += 1
+                    continue
+                if executor is None:
+                    executor = _start_pool(workers)
+                futures[executor.submit(_ingest_file, pdf_path, db_path)] = (pdf_path, stat)
+            if futures:
+                done, _ = wait(futures, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_path, stat = futures.pop(future)
+                    try:
+                        writer.add(future.result(), stat)
+                    except Exception as e:
+                        # Not recorded, so the next run tries the file again
+                        logger.error(f"Error ingesting PDF '{pdf_path}': {e}")
+                        counts["failed"] += 1
+            writer.commit_if_due()
+            progress.report()
+    except KeyboardInterrupt:
+        logger.info(f"Interrupted; saving finished results. {len(futures)} file(s) in flight will be redone next time.")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        writer.commit()
+        conn.close()
+        metrics.flush()
+    progress.report(force=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest every PDF under one or more directories.")
+    parser.add_argument("roots", nargs="+", help="Directories (or files) to ingest")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the SQLite database file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--in-flight", type=int, help="Most files queued or running at once (default: 2 x workers)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="PDFs committed per transaction")
+    parser.add_argument("--no-count", action="store_true", help="Do not count files up front (no ETA)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # SIGTERM stops the run the way Ctrl+C does
+    def _interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _interrupt)
+    ingest(args.roots, args.db, args.workers, args.in_flight, args.batch_size, count=not args.no_count)
+
+
+if __name__ == '__main__':
+    main()
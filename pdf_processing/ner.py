@@ -0,0 +1,192 @@
+"""
+Access to the spaCy NER pipeline: loaded in this process on first use, or reached through a
+shared inference process (see pdf_processing.ner_server) when NER_SERVER_ADDRESS is set.
+
+Either way callers get entity spans as (start_char, end_char, label) tuples, so the rest of
+the extraction never touches spaCy objects. spaCy itself is only imported when the model
+is loaded here, so processes that never run NER stay small and start fast.
+"""
+import importlib.metadata
+import logging
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "en_core_web_lg"
+
+# Unix socket of a shared NER server, e.g. data/ner.sock; NER runs in-process when unset
+NER_SERVER_ADDRESS = os.environ.get("NER_SERVER_ADDRESS")
+# Shared secret of the server; requests are unpickled, so the server never runs without one.
+# When unset, a server generates a random key and clients read it from its key file (see server_authkey)
+NER_SERVER_AUTHKEY = os.environ.get("NER_SERVER_AUTHKEY", "").encode() or None
+
+Span = Tuple[int, int, str]
+
+_nlp = None
+_nlp_lock = threading.Lock()
+_client = None
+_server_unreachable = False
+
+
+def trim_to_ner(nlp):
+    """Disable every pipeline component that date extraction does not read (tagger, parser, lemmatizer...)."""
+    keep = {"ner"}
+    if "ner" in nlp.pipe_names:
+        # Keep the shared tok2vec only if the NER component listens to it
+        model = getattr(nlp.get_pipe("ner"), "model", None)
+        if model is not None and any(node.name == "tok2vec-listener" for node in model.walk()):
+            keep.add("tok2vec")
+    nlp.select_pipes(enable=[name for name in nlp.pipe_names if name in keep])
+    return nlp
+
+
+def load_model():
+    import spacy
+    return trim_to_ner(spacy.load(MODEL_NAME))
+
+
+def get_nlp():
+    """Return this process's copy of the pipeline, loading it on first use."""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                logger.info(f"Loading spaCy model {MODEL_NAME}.")
+                _nlp = load_model()
+    return _nlp
+
+
+def model_version() -> str:
+    """Version of the installed model package, read without loading the model."""
+    try:
+        return importlib.metadata.version(MODEL_NAME)
+    except importlib.metadata.PackageNotFoundError:
+        return _nlp.meta.get("version", "0") if _nlp is not None else "0"
+
+
+def key_file(address: str) -> str:
+    """Where a NER server without a configured key writes the one it generated, readable by its owner only."""
+    return address + ".key"
+
+
+def server_authkey(address: str) -> Optional[bytes]:
+    """Key for the NER server at address: NER_SERVER_AUTHKEY, else the server's key file if this user can read it."""
+    if NER_SERVER_AUTHKEY is not None:
+        return NER_SERVER_AUTHKEY
+    try:
+        with open(key_file(address), "rb") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def doc_spans(doc) -> List[Span]:
+    return [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
+
+
+class NerClient:
+    """Connection to a NER server; one request at a time, reconnecting once if the connection drops."""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = authkey
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+        self._conn = None
+
+    def entities(self, texts: List[str]) -> List[List[Span]]:
+        """
+        :param texts: Texts to run NER on, sent as one request.
+        :return: The entity spans of each text, in order.
+        :raises OSError: The server cannot be reached.
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        self._conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                    self._conn.send(("entities", texts))
+                    status, payload = self._conn.recv()
+                    break
+                except (OSError, EOFError, AuthenticationError) as e:
+                    self._close()
+                    if attempt:
+                        raise OSError(f"NER server at {self.address} is unreachable: {e}") from e
+        if status != "ok":
+            raise RuntimeError(f"NER server failed: {payload}")
+        return payload
+
+
+def get_client() -> Optional[NerClient]:
+    """Return this process's NER server client, or None when NER runs in-process."""
+    global _client, _server_unreachable
+    if _client is None and NER_SERVER_ADDRESS and not _server_unreachable:
+        authkey = server_authkey(NER_SERVER_ADDRESS)
+        if authkey is None:
+            logger.warning(f"No key for the NER server at {NER_SERVER_ADDRESS} (set NER_SERVER_AUTHKEY); "
+                           f"running NER in this process.")
+            _server_unreachable = True
+            return None
+        _client = NerClient(NER_SERVER_ADDRESS, authkey)
+    return _client
+
+
+def _forget_client():
+    # A forked child must not share its parent's socket
+    global _client
+    _client = None
+
+
+os.register_at_fork(after_in_child=_forget_client)
+
+
+def _batch_entities(batch: List[Tuple[str, Any]]) -> Iterator[Tuple[str, List[Span], Any]]:
+    global _client, _server_unreachable
+    texts = [text for text, _ in batch]
+    client = get_client()
+    spans = None
+    if client is not None:
+        try:
+            spans = client.entities(texts)
+        except OSError as e:
+            # Slower and larger, but extraction keeps going
+            logger.warning(f"{e}; running NER in this process from now on.")
+            _client = None
+            _server_unreachable = True
+    if spans is None:
+        spans = [doc_spans(doc) for doc in get_nlp().pipe(texts)]
+    for (text, key), text_spans in zip(batch, spans):
+        yield text, text_spans, key
+
+
+def pipe_entities(items: Iterable[Tuple[str, Any]], batch_size: int, n_process: int = 1) -> Iterator[Tuple[str, List[Span], Any]]:
+    """
+    Run NER over many texts, through the NER server when one is configured.
+    :param items: Iterable of (text, key) tuples; consumed lazily.
+    :param batch_size: Texts per nlp.pipe batch, or per request to the server.
+    :param n_process: Processes nlp.pipe uses when running in-process.
+    :return: Iterator of (text, entity spans, key) tuples in input order.
+    """
+    if get_client() is None:
+        for doc, key in get_nlp().pipe(items, as_tuples=True, batch_size=batch_size, n_process=n_process):
+            yield doc.text, doc_spans(doc), key
+        return
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from _batch_entities(batch)
+            batch = []
+    if batch:
+        yield from _batch_entities(batch)
@@ -0,0 +1,192 @@
+"""
+Shared NER inference process.
+
+Usage: python -m pdf_processing.ner_server [--address data/ner.sock]
+
+Requests are pickled, so clients must authenticate with a shared key: NER_SERVER_AUTHKEY, or,
+when that is unset, a random key the server writes next to its socket (mode 0600). The socket
+itself is also only accessible to the user running the server.
+
+Loads the spaCy model once and serves entity spans over a Unix socket to every process
+started with NER_SERVER_ADDRESS pointing at the same socket (queue workers, pool workers,
+the API). Instead of one model copy per process there is one for the whole host. Requests
+from different clients that arrive while a batch is running are merged into the next
+nlp.pipe call. `python -m pdf_processing.worker --ner-server` starts one next to its workers.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from pdf_processing.ner import NER_SERVER_AUTHKEY, doc_spans, get_nlp, key_file, server_authkey
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = os.environ.get("NER_SERVER_ADDRESS") or os.path.join("data", "ner.sock")
+
+# Most texts run through one nlp.pipe call when requests are merged
+MAX_MERGED_TEXTS = int(os.environ.get("NER_SERVER_MAX_BATCH", 256))
+NER_BATCH_SIZE = int(os.environ.get("PDF_NER_BATCH_SIZE", 32))
+
+# Seconds start_ner_server waits for the model to load and the socket to accept connections
+STARTUP_TIMEOUT = float(os.environ.get("NER_SERVER_STARTUP_TIMEOUT", 300))
+
+
+class _Request:
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def _inference_loop(nlp, requests):
+    """Run NER for queued requests, merging those that are waiting into one batch."""
+    while True:
+        batch = [requests.get()]
+        size = len(batch[0].texts)
+        while size < MAX_MERGED_TEXTS:
+            try:
+                request = requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        texts = [text for request in batch for text in request.texts]
+        try:
+            spans = [doc_spans(doc) for doc in nlp.pipe(texts, batch_size=NER_BATCH_SIZE)]
+        except Exception as e:
+            logger.error(f"NER failed for a batch of {len(texts)} text(s): {e}")
+            for request in batch:
+                request.error = str(e)
+                request.done.set()
+            continue
+        start = 0
+        for request in batch:
+            request.result = spans[start:start + len(request.texts)]
+            start += len(request.texts)
+            request.done.set()
+
+
+def _serve_connection(conn, requests):
+    with conn:
+        while True:
+            try:
+                command, texts = conn.recv()
+            except (EOFError, OSError):
+                return
+            if command != "entities":
+                conn.send(("error", f"Unknown command {command!r}"))
+                continue
+            request = _Request(texts)
+            requests.put(request)
+            request.done.wait()
+            try:
+                conn.send(("error", request.error) if request.error is not None else ("ok", request.result))
+            except OSError:
+                return
+
+
+def _write_key_file(address, authkey):
+    path = key_file(address)
+    if os.path.exists(path):
+        os.remove(path)
+    # Created with owner-only permissions, never readable by others even for a moment
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+
+
+def serve(address=DEFAULT_ADDRESS, authkey=NER_SERVER_AUTHKEY):
+    """
+    Load the model and serve clients until SIGTERM or Ctrl+C.
+    :param authkey: Key clients must present; when None, a random one is generated and written to key_file(address).
+    """
+    nlp = get_nlp()
+    # A socket file left behind by a process that was killed would make the bind fail
+    if os.path.exists(address):
+        os.remove(address)
+    directory = os.path.dirname(address)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if authkey is None:
+        authkey = secrets.token_hex(32).encode()
+        _write_key_file(address, authkey)
+    requests = queue.Queue()
+    threading.Thread(target=_inference_loop, args=(nlp, requests), name="ner-inference", daemon=True).start()
+
+    def _terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    # The umask covers the moment between bind and chmod
+    old_umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    os.chmod(address, 0o600)
+    logger.info(f"NER server listening on {address}.")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                # e.g. a client that failed authentication
+                logger.warning(f"Rejected a NER client: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, requests), daemon=True).start()
+    finally:
+        listener.close()
+
+
+def _server_process_main(address, authkey):
+    # Ctrl+C reaches the whole process group; the parent decides when the server stops
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    serve(address, authkey)
+
+
+def start_ner_server(address=DEFAULT_ADDRESS, authkey=NER_SERVER_AUTHKEY, timeout=STARTUP_TIMEOUT):
+    """
+    Start a NER server process and wait until it accepts connections.
+    :param authkey: Key clients must present; pass the same one to the clients (e.g. via NER_SERVER_AUTHKEY).
+    :return: The server process.
+    :raises RuntimeError: The server exited or did not come up within timeout seconds.
+    """
+    process = multiprocessing.get_context("spawn").Process(target=_server_process_main, args=(address, authkey),
+                                                           name="ner-server")
+    process.start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError(f"NER server exited with code {process.exitcode}")
+        try:
+            Client(address, family="AF_UNIX", authkey=authkey if authkey is not None else server_authkey(address)).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"NER server did not start within {timeout:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve NER for all local processes from one model copy.")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="Path of the Unix socket")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        serve(args.address)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
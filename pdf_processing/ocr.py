@@ -0,0 +1,165 @@
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Executable used for OCR. Point it at a stub script to run without ocrmypdf installed.
+OCR_COMMAND = shlex.split(os.environ.get("OCR_COMMAND", "ocrmypdf"))
+
+# How many OCR subprocesses may run at once, and how many threads each one gets (ocrmypdf --jobs)
+OCR_MAX_JOBS = int(os.environ.get("OCR_MAX_JOBS", 2))
+OCR_THREADS_PER_JOB = int(os.environ.get("OCR_THREADS_PER_JOB", 1))
+
+# Seconds a single OCR job may run before it is killed
+OCR_TIMEOUT = float(os.environ.get("OCR_TIMEOUT", 900))
+
+OCR_OK = "ok"
+OCR_NOT_NEEDED = "not_needed"
+OCR_FAILED = "failed"
+OCR_TIMED_OUT = "timeout"
+OCR_CANCELLED = "cancelled"
+
+
+def page_ranges(page_numbers: List[int]) -> str:
+    """Format sorted page numbers the way ocrmypdf --pages expects them, e.g. "1-3,7"."""
+    ranges = []
+    for page_number in page_numbers:
+        if ranges and ranges[-1][1] == page_number - 1:
+            ranges[-1][1] = page_number
+        else:
+            ranges.append([page_number, page_number])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def _kill_process_group(process: subprocess.Popen):
+    """Kill an OCR subprocess and everything it started. Killing only the child would leave its
+    children running, holding the stderr pipe open and blocking communicate() until they finish."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # Already gone (an exited leader whose group is empty)
+        pass
+
+
+class OcrScheduler:
+    """
+    Runs OCR subprocesses in the background with bounded parallelism.
+    Each job gets a timeout and can be cancelled, and every job ends with a result dict
+    {"status", "output_path", "error"} instead of raising, so callers can record failures.
+    """
+
+    def __init__(self, max_jobs: int = OCR_MAX_JOBS, threads_per_job: int = OCR_THREADS_PER_JOB,
+                 timeout: float = OCR_TIMEOUT, command: Optional[List[str]] = None, slots=None):
+        """
+        :param max_jobs: Number of OCR subprocesses this scheduler runs at once.
+        :param threads_per_job: Value passed to ocrmypdf --jobs.
+        :param timeout: Seconds before a running job is killed.
+        :param command: OCR executable and leading arguments; defaults to OCR_COMMAND.
+        :param slots: Optional semaphore (e.g. multiprocessing.BoundedSemaphore) shared with other
+                      processes, so the OCR limit holds across a whole process pool.
+        """
+        self.threads_per_job = threads_per_job
+        self.timeout = timeout
+        self.command = list(command or OCR_COMMAND)
+        self._slots = slots
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="ocr")
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self._cancelled = set()
+
+    def submit(self, pdf_path: str, output_path: str, page_numbers: Optional[List[int]] = None) -> Future:
+        """
+        Queue an OCR job.
+        :param pdf_path: Path to the input PDF; also identifies the job for cancel().
+        :param output_path: Where the OCR-processed PDF is written.
+        :param page_numbers: 1-based pages to OCR; all pages when None.
+        :return: Future resolving to the job's result dict.
+        """
+        with self._lock:
+            self._cancelled.discard(pdf_path)
+            future = self._executor.submit(self._run_job, pdf_path, output_path, page_numbers)
+            self._futures[pdf_path] = future
+        future.add_done_callback(lambda _: self._forget(pdf_path, future))
+        return future
+
+    def run(self, pdf_path: str, output_path: str, page_numbers: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Submit an OCR job and wait for its result."""
+        return self.submit(pdf_path, output_path, page_numbers).result()
+
+    def cancel(self, pdf_path: str):
+        """Cancel a queued job, or kill the subprocess of a running one."""
+        with self._lock:
+            self._cancelled.add(pdf_path)
+            future = self._futures.get(pdf_path)
+            process = self._processes.get(pdf_path)
+        if future is not None:
+            future.cancel()
+        if process is not None:
+            _kill_process_group(process)
+
+    def cancel_all(self):
+        with self._lock:
+            pdf_paths = list(self._futures)
+        for pdf_path in pdf_paths:
+            self.cancel(pdf_path)
+
+    def shutdown(self, cancel: bool = False):
+        if cancel:
+            self.cancel_all()
+        self._executor.shutdown(wait=True)
+
+    def _forget(self, pdf_path: str, future: Future):
+        with self._lock:
+            if self._futures.get(pdf_path) is future:
+                del self._futures[pdf_path]
+
+    def _build_command(self, pdf_path: str, output_path: str, page_numbers: Optional[List[int]]) -> List[str]:
+        cmd = self.command + ["--jobs", str(self.threads_per_job)]
+        if page_numbers:
+            cmd += ["--force-ocr", "--pages", page_ranges(page_numbers)]
+        else:
+            cmd += ["--skip-text"]
+        return cmd + [pdf_path, output_path]
+
+    def _run_job(self, pdf_path: str, output_path: str, page_numbers: Optional[List[int]]) -> Dict[str, Any]:
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            with self._lock:
+                if pdf_path in self._cancelled:
+                    return {"status": OCR_CANCELLED, "output_path": None, "error": "cancelled before start"}
+                # Its own session, so the tesseract and ghostscript processes ocrmypdf starts can be killed with it
+                process = subprocess.Popen(self._build_command(pdf_path, output_path, page_numbers),
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+                self._processes[pdf_path] = process
+            try:
+                _, stderr = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                _kill_process_group(process)
+                process.communicate()
+                logger.error(f"OCR for '{pdf_path}' timed out after {self.timeout}s.")
+                return {"status": OCR_TIMED_OUT, "output_path": None, "error": f"timed out after {self.timeout}s"}
+            finally:
+                with self._lock:
+                    self._processes.pop(pdf_path, None)
+        except OSError as e:
+            logger.error(f"Could not start OCR for '{pdf_path}': {e}")
+            return {"status": OCR_FAILED, "output_path": None, "error": str(e)}
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+        if pdf_path in self._cancelled:
+            return {"status": OCR_CANCELLED, "output_path": None, "error": "cancelled"}
+        if process.returncode != 0:
+            error = stderr.decode(errors="replace").strip()[-2000:]
+            logger.error(f"OCR for '{pdf_path}' failed with exit code {process.returncode}: {error}")
+            return {"status": OCR_FAILED, "output_path": None, "error": f"exit code {process.returncode}: {error}"}
+        return {"status": OCR_OK, "output_path": output_path, "error": None}
@@ -1,19 +1,57 @@
-from database.connection import create_connection
-from database.operations import insert_pdf_data, insert_date_data
+from database.connection import create_write_connection, database_file
+from monitoring import metrics
+from database.operations import (initialize_database, insert_pdf_with_dates, find_pdfs_by_hash, claim_pdf,
+                                 renew_pdf_lease, release_pdf, store_page_results, finish_pdf, PdfLeaseLost,
+                                 PDF_IN_PROGRESS, PDF_LEASE_SECONDS)
+from pdf_processing.date_normalizer import normalize_date
+from pdf_processing.hashing import file_sha256
+from pdf_processing.ner import MODEL_NAME, get_client, get_nlp, model_version, pipe_entities
+from pdf_processing.ocr import OcrScheduler, OCR_MAX_JOBS, OCR_OK, OCR_NOT_NEEDED
+from pdf_processing.text_index import WordIndex
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Callable, Set
 import fitz  # PyMuPDF
-import spacy
 import re
-import subprocess
+import hashlib
+import time
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load the spaCy model
-nlp = spacy.load("en_core_web_lg")
+# Number of processes used by process_and_store_pdfs when the caller does not say
+DEFAULT_WORKERS = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 1))
+
+# Pages with fewer non-whitespace characters than this are treated as scans and OCRed
+MIN_PAGE_TEXT_CHARS = int(os.environ.get("PDF_MIN_PAGE_TEXT_CHARS", 16))
+
+# Texts per nlp.pipe batch in batched extraction. NER runs in one process per worker; parallelism
+# comes from the worker processes (PDF_WORKERS, --workers, queue workers), not from nlp.pipe's n_process
+NER_BATCH_SIZE = int(os.environ.get("PDF_NER_BATCH_SIZE", 32))
+
+# Pages whose dates are committed together by process_and_store_pdf; a crash loses at most this many
+CHECKPOINT_PAGES = int(os.environ.get("PDF_CHECKPOINT_PAGES", 50))
+
+# Seconds between checks while another process holds the lease on the same document
+PDF_BUSY_POLL_SECONDS = float(os.environ.get("PDF_BUSY_POLL_SECONDS", 2))
+
+
+# Created lazily by get_ocr_scheduler, or by _init_worker in pool and queue workers
+_ocr_scheduler = None
+
+# The spaCy model is loaded on first use (pdf_processing.ner.get_nlp), or not at all in this
+# process when a shared NER server is configured
 
 # Define a regex pattern for date extraction
 date_regex = re.compile(
@@ -24,85 +62,558 @@ date_regex = re.compile(
     re.VERBOSE,
 )
 
-def perform_ocr_if_needed(pdf_paths: List[str]) -> List[str]:
-    ocr_output_paths = []
-    for pdf_path in pdf_paths:
-        try:
-            with fitz.open(pdf_path) as doc:
-                if all(page.get_text() for page in doc):
-                    logger.info(f"PDF '{pdf_path}' already contains text. Skipping OCR.")
-                    ocr_output_paths.append(pdf_path)
-                    continue
+# Cheap first tier in front of NER: whole month and weekday names and their abbreviations, year-like or separated digit groups,
+# ordinals and relative date words. A page with none of these is not sent to spaCy at all.
+date_hint_regex = re.compile(
+    r"""
+    \b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?
+        |oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b
+    | \b(?:mon|tues?|wed(?:nes)?|thu(?:rs)?|fri|sat(?:ur)?|sun)(?:day)?\b
+    | \b(?:today|tomorrow|yesterday|tonight|days?|weeks?|months?|years?|decades?|century|centuries|quarters?|annual(?:ly)?)\b
+    | \b\d{4}s?\b
+    | \b\d{1,2}(?:st|nd|rd|th)\b
+    | \b\d{1,4}[-/.]\d{1,2}\b
+    """,
+    re.VERBOSE | re.IGNORECASE,
+)
 
-            ocr_output_path = str(Path(pdf_path).with_suffix('') + "_ocr.pdf")
-            subprocess.run(["ocrmypdf", "--skip-text", pdf_path, ocr_output_path], check=True)
-            logger.info(f"OCR completed for '{pdf_path}'. Output saved to '{ocr_output_path}'.")
-            ocr_output_paths.append(ocr_output_path)
-        except Exception as e:
-            logger.error(f"Error during OCR process for '{pdf_path}': {e}")
-            ocr_output_paths.append(pdf_path)  # Use original if error
-    return ocr_output_paths
 
-def extract_dates_from_text(text: str, context_words: int = 50) -> List[Dict[str, str]]:
+# Key stored next to every processed PDF. Cached results under any other key (new model,
+# edited regexes, pipeline changes) are re-extracted the next time the same file comes in.
+PIPELINE_VERSION = 1
+EXTRACTOR_VERSION = "{}-{}/re-{}/p{}".format(
+    MODEL_NAME,
+    model_version(),
+    hashlib.sha1((date_regex.pattern + date_hint_regex.pattern).encode()).hexdigest()[:8],
+    PIPELINE_VERSION,
+)
+
+
+# Reused timers for the per-page stages; a timer keeps its start times per thread
+_text_timer = metrics.STAGE_SECONDS.time(stage="text")
+_prefilter_timer = metrics.STAGE_SECONDS.time(stage="prefilter")
+_dates_timer = metrics.STAGE_SECONDS.time(stage="dates")
+_ocr_timer = metrics.STAGE_SECONDS.time(stage="ocr")
+
+
+def page_may_contain_dates(text: str) -> bool:
+    """Return False only for text that cannot hold a date; regex hits always pass this check."""
+    return date_hint_regex.search(text) is not None or date_regex.search(text) is not None
+
+
+def get_ocr_scheduler() -> OcrScheduler:
+    """Return this process's OCR scheduler, creating it on first use."""
+    global _ocr_scheduler
+    if _ocr_scheduler is None:
+        _ocr_scheduler = OcrScheduler()
+    return _ocr_scheduler
+
+
+def cancel_ocr():
+    """Kill this process's queued and running OCR jobs, e.g. when the process has to stop now."""
+    if _ocr_scheduler is not None:
+        _ocr_scheduler.cancel_all()
+
+
+def _init_worker(ocr_slots):
+    """Pool and queue worker initializer: OCR jobs of all workers share one limit of OCR_MAX_JOBS."""
+    global _ocr_scheduler
+    _ocr_scheduler = OcrScheduler(max_jobs=1, slots=ocr_slots)
+
+
+def _dates_from_spans(text: str, spans: List[Tuple[int, int, str]], context_words: Optional[int]) -> List[Dict[str, Any]]:
+    # Without a context width only offsets are returned; contexts are then built on read from the stored page text
+    index = WordIndex(text) if context_words is not None else None
     dates = []
-    doc = nlp(text)
-    # Process NER dates
-    for ent in doc.ents:
-        if ent.label_ == "DATE":
-            start = max(0, ent.start - context_words)
-            end = min(len(doc), ent.end + context_words)
-            context = ' '.join([doc[i].text for i in range(start, end)])
-            dates.append({"text": ent.text, "context": context})
-    
-    # Process regex dates
+    # Process NER dates; entity spans are sorted and never overlap each other
+    ner_starts = []
+    ner_ends = []
+    for start_char, end_char, label in spans:
+        if label == "DATE":
+            ner_starts.append(start_char)
+            ner_ends.append(end_char)
+            dates.append({"text": text[start_char:end_char],
+                          "context": index.context(start_char, end_char, context_words) if index else None,
+                          "start_char": start_char, "end_char": end_char})
+
+    # Process regex dates, keeping only those whose span does not overlap an NER date
     for match in date_regex.finditer(text):
-        date_text = match.group(0)
-        if not any(date["text"] == date_text for date in dates):
-            # Approximate start and end positions for context_words around the regex match
-            match_start_pos = match.start()
-            match_end_pos = match.end()
-            # Convert match positions to approximate word counts by splitting the text
-            words_before_match = text[:match_start_pos].split()[-context_words:]
-            words_after_match = text[match_end_pos:].split()[:context_words]
-            # Reconstruct the context with the specified number of words before and after the date
-            context = ' '.join(words_before_match + [date_text] + words_after_match)
-            dates.append({"text": date_text, "context": context})
+        i = bisect_left(ner_starts, match.end())
+        if i > 0 and ner_ends[i - 1] > match.start():
+            continue
+        dates.append({"text": match.group(0), "context": index.context(match.start(), match.end(), context_words) if index else None,
+                      "start_char": match.start(), "end_char": match.end()})
 
+    dates.sort(key=lambda date: date["start_char"])
+    for date in dates:
+        normalized = normalize_date(date["text"])
+        if normalized is not None:
+            date["date_start"], date["date_end"], date["date_precision"] = normalized
     return dates
 
 
+def extract_dates_from_text(text: str, context_words: int = 50) -> List[Dict[str, Any]]:
+    return next(extract_dates_batched([(text, None)], context_words, n_process=1, prefilter=False))[1]
+
+
+def _prefiltered(items: Iterable[Tuple[str, Any]], stats: Optional[Counter]):
+    # Skipped texts still go through NER, as empty strings, so output order is preserved
+    for text, key in items:
+        with _prefilter_timer:
+            keep = page_may_contain_dates(text)
+        if not keep:
+            metrics.PAGES_SKIPPED.inc()
+        if stats is not None:
+            stats["pages"] += 1
+            if not keep:
+                stats["pages_skipped"] += 1
+        yield (text if keep else ""), (key, keep)
+
+
+def extract_dates_batched(items: Iterable[Tuple[str, Any]], context_words: Optional[int] = 50,
+                          batch_size: int = NER_BATCH_SIZE, n_process: int = 1,
+                          prefilter: bool = True, stats: Optional[Counter] = None) -> Iterator[Tuple[Any, List[Dict[str, Any]]]]:
+    """
+    Run date extraction over many texts at once through nlp.pipe, or the NER server when configured.
+    :param items: Iterable of (text, key) tuples. The key is passed through untouched so results
+                  can be mapped back to their source, e.g. (pdf_path, page_number).
+    :param context_words: Number of words of context to keep on each side of a date; None to return
+                          only the "start_char" and "end_char" offsets, with a None context.
+    :param batch_size: Number of texts spaCy processes per batch (or sent per NER server request).
+    :param n_process: Number of processes nlp.pipe uses; only for standalone callers, never inside pool workers.
+    :param prefilter: Skip NER for texts that fail page_may_contain_dates.
+    :param stats: Optional Counter updated with "pages" and "pages_skipped".
+    :return: Iterator of (key, dates) tuples in input order.
+    """
+    if not prefilter:
+        items = ((text, (key, True)) for text, key in items)
+    else:
+        items = _prefiltered(items, stats)
+    source = _ClockedIterator(items)
+    entities = pipe_entities(source, batch_size, n_process)
+    while True:
+        # NER pulls its input lazily, so time spent reading and OCRing pages is taken out of the NER time
+        start, source_seconds = time.perf_counter(), source.seconds
+        item = next(entities, None)
+        if item is None:
+            return
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start - (source.seconds - source_seconds), stage="ner")
+        text, spans, (key, keep) = item
+        if not keep:
+            yield key, []
+            continue
+        with _dates_timer:
+            dates = _dates_from_spans(text, spans, context_words)
+        metrics.DATES.inc(len(dates))
+        yield key, dates
+
+
+class _ClockedIterator:
+    """Iterator wrapper that adds up the time spent producing items."""
+
+    def __init__(self, items):
+        self.items = iter(items)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self.items)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def iter_page_texts(pdf_path: str, ocr_info: Optional[Dict[str, Any]] = None, ocr: bool = True,
+                    skip_pages: Optional[Set[int]] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yield the text of a PDF one page at a time so the whole document is never held in memory.
+    Text detection and extraction happen in the same pass. Pages with (almost) no text are
+    collected and, once the native pages are done, OCRed together and yielded from the OCR output,
+    so they come last rather than in page order.
+    :param pdf_path: Path to the PDF file.
+    :param ocr_info: Optional dict; "ocr_status" and "ocr_error" are set in it when OCR runs,
+                     "ocr_path" and "ocr_pages" when it succeeds.
+    :param ocr: Set to False to yield the native text of every page without running OCR.
+    :param skip_pages: Page numbers that are neither read nor OCRed, e.g. pages already checkpointed.
+    :return: Iterator of (page_number, text) tuples; page numbers start at 1.
+    """
+    blank_pages = {}
+    with fitz.open(pdf_path) as doc:
+        for page_index, page in enumerate(doc):
+            if skip_pages and page_index + 1 in skip_pages:
+                continue
+            with _text_timer:
+                text = page.get_text()
+            metrics.PAGES.inc()
+            if ocr and len(text.strip()) < MIN_PAGE_TEXT_CHARS:
+                blank_pages[page_index + 1] = text
+                continue
+            yield page_index + 1, text
+
+    if not blank_pages:
+        logger.info(f"PDF '{pdf_path}' already contains text. Skipping OCR.")
+        return
+
+    ocr_pdf_path = str(Path(pdf_path).with_suffix('')) + "_ocr.pdf"
+    with _ocr_timer:
+        result = get_ocr_scheduler().run(pdf_path, ocr_pdf_path, sorted(blank_pages))
+    metrics.OCR_RUNS.inc(status=result["status"])
+    metrics.PAGES_OCR.inc(len(blank_pages))
+    if ocr_info is not None:
+        ocr_info["ocr_status"] = result["status"]
+        ocr_info["ocr_error"] = result["error"]
+    if result["status"] != OCR_OK:
+        # The failure is recorded on the PDFs row; only the pages' native text is available
+        yield from blank_pages.items()
+        return
+
+    logger.info(f"OCR completed for {len(blank_pages)} page(s) of '{pdf_path}'. Output saved to '{ocr_pdf_path}'.")
+    if ocr_info is not None:
+        ocr_info["ocr_path"] = ocr_pdf_path
+        ocr_info["ocr_pages"] = len(blank_pages)
+    with fitz.open(ocr_pdf_path) as doc:
+        for page_number in sorted(blank_pages):
+            with _text_timer:
+                text = doc[page_number - 1].get_text()
+            yield page_number, text
+
+
+def extract_dates_from_pages(pages: Iterable[Tuple[int, str]], context_words: Optional[int] = 50,
+                             batch_size: int = NER_BATCH_SIZE, stats: Optional[Counter] = None,
+                             page_texts: Optional[Dict[int, str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Run date extraction page by page, batching pages through nlp.pipe, and stream the results onward.
+    :param pages: Iterable of (page_number, text) tuples, e.g. from iter_page_texts.
+    :param context_words: Number of words of context to keep on each side of a date, or None for offsets only.
+    :param batch_size: Number of pages spaCy processes per batch.
+    :param stats: Optional Counter updated with "pages" and "pages_skipped".
+    :param page_texts: Optional dict filled with the text of every page that has dates.
+    :return: Iterator of date dicts with "text", "context" and "page_number" keys.
+    """
+    items = ((text, (page_number, text)) for page_number, text in pages)
+    for (page_number, text), dates in extract_dates_batched(items, context_words, batch_size, n_process=1, stats=stats):
+        if dates and page_texts is not None:
+            page_texts[page_number] = text
+        for date in dates:
+            date["page_number"] = page_number
+            yield date
+
+
 def process_pdfs(pdf_paths: List[str]) -> List[Dict[str, Any]]:
     processed_data = []
-    ocr_pdf_paths = perform_ocr_if_needed(pdf_paths)
-    for ocr_pdf_path in ocr_pdf_paths:
+    for pdf_path in pdf_paths:
         try:
-            extracted_text = ""
-            with fitz.open(ocr_pdf_path) as doc:
-                for page in doc:
-                    extracted_text += page.get_text()
-            dates = extract_dates_from_text(extracted_text)
-            processed_data.append({"pdf_path": ocr_pdf_path, "dates": dates})
+            ocr_info = {"ocr_path": pdf_path}
+            dates = list(extract_dates_from_pages(iter_page_texts(pdf_path, ocr_info)))
+            processed_data.append({"pdf_path": ocr_info["ocr_path"], "dates": dates})
         except Exception as e:
-            logger.error(f"Error processing PDF '{ocr_pdf_path}': {e}")
+            logger.error(f"Error processing PDF '{pdf_path}': {e}")
     return processed_data
     
 
-def process_and_store_pdfs(pdf_paths: List[str], db_path: str):
-    conn = create_connection(db_path)
+def _with_progress(pages: Iterable[Tuple[int, str]], progress: Callable[[int, int], None], pages_total: int):
+    for pages_done, page in enumerate(pages, start=1):
+        yield page
+        progress(pages_done, pages_total)
+
+
+@contextmanager
+def _document_metrics():
+    """Record the outcome and duration of one PDF, then publish this process's metrics."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.DOCUMENTS.inc(outcome="failed")
+        raise
+    else:
+        metrics.DOCUMENTS.inc(outcome="processed")
+    finally:
+        metrics.DOCUMENT_SECONDS.observe(time.perf_counter() - start)
+        metrics.flush()
+
+
+def _extract_pdf(pdf_path: str, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Run OCR (if needed), text extraction and date extraction for a single PDF.
+    Safe to call from a pool worker: it never touches the database.
+    :param pdf_path: Path to the original PDF file.
+    :param progress: Optional callback, called as progress(pages_done, pages_total) after each page is read.
+    :return: Dict with the original path, the OCR path, the extracted dates (offsets only), the text
+             of the pages with dates and page counters.
+    """
+    ocr_info = {"ocr_path": pdf_path, "ocr_pages": 0, "ocr_status": OCR_NOT_NEEDED, "ocr_error": None}
+    stats = Counter()
+    page_texts = {}
+    with _document_metrics():
+        pages = iter_page_texts(pdf_path, ocr_info)
+        if progress is not None:
+            with fitz.open(pdf_path) as doc:
+                pages_total = doc.page_count
+            progress(0, pages_total)
+            pages = _with_progress(pages, progress, pages_total)
+        # Contexts are not built here: the database stores offsets and page texts instead
+        dates = list(extract_dates_from_pages(pages, context_words=None, stats=stats, page_texts=page_texts))
+    stats["pages_ocr"] += ocr_info["ocr_pages"]
+    return {"pdf_path": pdf_path, "ocr_path": ocr_info["ocr_path"], "ocr_status": ocr_info["ocr_status"],
+            "ocr_error": ocr_info["ocr_error"], "dates": dates, "page_texts": page_texts, "stats": stats}
+
+
+def _store_result(conn, result: Dict[str, Any], content_hash: str, stale_pdf_ids: List[int]):
+    # One transaction per PDF; results from an older extractor version are replaced, not kept alongside
+    pdf_path = result["pdf_path"]
+    ocr_pdf_path = result["ocr_path"]
+    return insert_pdf_with_dates(conn, pdf_path, ocr_pdf_path, ocr_pdf_path != pdf_path, result["dates"],
+                                 content_hash, EXTRACTOR_VERSION, result["ocr_status"], result["ocr_error"], stale_pdf_ids,
+                                 result["page_texts"])
+
+
+def _check_cache(conn, content_hash: str, leased_is_cached: bool = False):
+    """
+    :param leased_is_cached: Treat content that another process is filling in under a live lease as
+                             cached; batch runs skip it and leave it to that process.
+    :return: (id of a PDF already processed from this content with the current EXTRACTOR_VERSION or None,
+              ids of PDFs from this content that were processed with another version or left unfinished;
+              entries under a live lease are never among them)
+    """
+    cached = find_pdfs_by_hash(conn, content_hash)
+    now = time.time()
+    stale_pdf_ids = []
+    for pdf_id, version, ocr_status, status, lease_expires_at in cached:
+        leased = status == PDF_IN_PROGRESS and (lease_expires_at or 0) >= now
+        if leased and leased_is_cached:
+            return pdf_id, []
+        # Results from a failed or timed-out OCR run are retried rather than reused,
+        # and partially stored (in-progress) results are never reused as they stand
+        if version == EXTRACTOR_VERSION and ocr_status in (OCR_OK, OCR_NOT_NEEDED, None) and status != PDF_IN_PROGRESS:
+            return pdf_id, []
+        if not leased:
+            stale_pdf_ids.append(pdf_id)
+    return None, stale_pdf_ids
+
+
+def _plan_batch(conn, pdf_paths: List[str], content_hashes: Dict[str, str]):
+    """
+    Decide which PDFs of a batch actually need extraction.
+    A file whose content hash is already stored with the current EXTRACTOR_VERSION is skipped,
+    as is a second copy of the same content within the batch.
+    :return: (paths to process, hash per path, stale pdf ids to replace per path)
+    """
+    to_process = []
+    hashes = {}
+    stale = {}
+    for pdf_path in pdf_paths:
+        try:
+            content_hash = content_hashes.get(pdf_path) or file_sha256(pdf_path)
+        except OSError as e:
+            logger.error(f"Error hashing PDF '{pdf_path}': {e}")
+            continue
+        if content_hash in hashes.values():
+            logger.info(f"PDF '{pdf_path}' duplicates another file in this batch. Skipping.")
+            continue
+        cached_pdf_id, stale_pdf_ids = _check_cache(conn, content_hash, leased_is_cached=True)
+        if cached_pdf_id is not None:
+            logger.info(f"PDF '{pdf_path}' was already processed with {EXTRACTOR_VERSION}, or is being processed "
+                        f"by another worker. Skipping.")
+            metrics.DOCUMENTS.inc(outcome="cached")
+            continue
+        to_process.append(pdf_path)
+        hashes[pdf_path] = content_hash
+        stale[pdf_path] = stale_pdf_ids
+    return to_process, hashes, stale
+
+
+def _iter_results(pdf_paths: List[str], workers: int):
+    """Yield (pdf_path, result, error) tuples, in completion order when running in a pool."""
+    if workers <= 1 or len(pdf_paths) <= 1:
+        for pdf_path in pdf_paths:
+            try:
+                yield pdf_path, _extract_pdf(pdf_path), None
+            except Exception as e:
+                yield pdf_path, None, e
+        return
+
+    # Loaded before forking, the model is shared copy-on-write by the workers; under spawn each
+    # worker loads its own on first use. With a NER server none of them loads it.
+    if get_client() is None and multiprocessing.get_start_method() == "fork":
+        get_nlp()
+    ocr_slots = multiprocessing.BoundedSemaphore(OCR_MAX_JOBS)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ocr_slots,)) as executor:
+        futures = {executor.submit(_extract_pdf, pdf_path): pdf_path for pdf_path in pdf_paths}
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                yield pdf_path, future.result(), None
+            except Exception as e:
+                yield pdf_path, None, e
+
+
+def process_and_store_pdfs(pdf_paths: List[str], db_path: str, workers: Optional[int] = None,
+                           content_hashes: Optional[Dict[str, str]] = None):
+    """
+    Process a list of PDF paths for OCR and date extraction, then store the results in the database.
+    With more than one worker the PDFs are extracted in a process pool; only this (parent)
+    process writes to SQLite. Files already processed with the current extractor version
+    (matched by content hash) are not processed again.
+    :param pdf_paths: List of paths to the PDF files.
+    :param db_path: Path to the SQLite database file.
+    :param workers: Number of worker processes. Defaults to PDF_WORKERS or the CPU count.
+    :param content_hashes: SHA-256 per path when already known (e.g. computed during upload).
+    """
+    if workers is None:
+        workers = DEFAULT_WORKERS
+    conn = create_write_connection(db_path)
     if conn:
+        totals = Counter()
         try:
-            for pdf_path in pdf_paths:
-                ocr_pdf_paths = perform_ocr_if_needed([pdf_path])
-                for ocr_pdf_path in ocr_pdf_paths:
-                    extracted_text = ""  # Logic for extracting text
-                    # Assuming text extraction logic here...
-                    dates = extract_dates_from_text(extracted_text)
-                    pdf_id = insert_pdf_data(conn, pdf_path, ocr_pdf_path, ocr_pdf_path != pdf_path)
-                    for date in dates:
-                        insert_date_data(conn, pdf_id, date['text'], date['context'], 0)  # Example usage
-        except Exception as e:
-            logger.error(f"Error processing PDF '{ocr_pdf_path}': {e}")
+            initialize_database(conn)
+            pdf_paths, hashes, stale = _plan_batch(conn, pdf_paths, content_hashes or {})
+            for pdf_path, result, error in _iter_results(pdf_paths, min(workers, len(pdf_paths))):
+                if error is not None:
+                    logger.error(f"Error processing PDF '{pdf_path}': {error}")
+                    continue
+                totals.update(result["stats"])
+                try:
+                    _store_result(conn, result, hashes[pdf_path], stale[pdf_path])
+                except Exception as e:
+                    logger.error(f"Error storing results for PDF '{pdf_path}': {e}")
         finally:
             conn.close()
+            metrics.flush()
+        logger.info(f"Pre-filter skipped NER on {totals['pages_skipped']} of {totals['pages']} pages; "
+                    f"{totals['pages_ocr']} page(s) were OCRed.")
     else:
-        logger.error("Error! Cannot create the database connection.")
\ No newline at end of file
+        logger.error("Error! Cannot create the database connection.")
+
+
+def process_and_store_pdf(conn, pdf_path: str, content_hash: Optional[str] = None,
+                          progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Process a single PDF in this process and store its results; used by the job queue workers.
+    Dates are committed every CHECKPOINT_PAGES pages together with the page numbers they cover,
+    so when a run is interrupted the next run for the same content resumes after the last
+    committed page instead of starting over. The in-progress entry is leased (see claim_pdf):
+    while another process is filling in the same content, this call waits for it to finish.
+    :param conn: Write connection to the database.
+    :param pdf_path: Path to the PDF file.
+    :param content_hash: SHA-256 of the file when already known.
+    :param progress: Optional callback, called as progress(pages_done, pages_total).
+    :return: The id of the PDFs row holding the results (an existing one if the content was cached).
+    :raises PdfLeaseLost: Another process took over the document, e.g. after this one stalled.
+    """
+    content_hash = content_hash or file_sha256(pdf_path)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    pages_total = None
+    waiting = False
+    while True:
+        cached_pdf_id, stale_pdf_ids = _check_cache(conn, content_hash)
+        if cached_pdf_id is not None:
+            logger.info(f"PDF '{pdf_path}' was already processed with {EXTRACTOR_VERSION}. Reusing cached results.")
+            metrics.DOCUMENTS.inc(outcome="cached")
+            return cached_pdf_id
+        if pages_total is None:
+            # Opened only once the content is known to need work
+            with fitz.open(pdf_path) as doc:
+                pages_total = doc.page_count
+        claimed = claim_pdf(conn, pdf_path, content_hash, EXTRACTOR_VERSION, pages_total, owner)
+        if claimed is not None:
+            break
+        if not waiting:
+            logger.info(f"PDF '{pdf_path}' is being processed by another worker. Waiting for its results.")
+            waiting = True
+        time.sleep(PDF_BUSY_POLL_SECONDS)
+
+    keeper = _PdfLeaseKeeper(database_file(conn), claimed["id"], owner)
+    keeper.start()
+    try:
+        with _document_metrics():
+            return _process_and_store_checkpointed(conn, pdf_path, claimed, owner, pages_total, stale_pdf_ids,
+                                                   progress, keeper)
+    except PdfLeaseLost:
+        raise
+    except BaseException:
+        # Let the next run resume straight away instead of waiting for the lease to expire
+        release_pdf(conn, claimed["id"], owner)
+        raise
+    finally:
+        keeper.stop()
+
+
+class _PdfLeaseKeeper(threading.Thread):
+    """Extends the lease on an in-progress PDF every third of the lease period, on its own connection."""
+
+    def __init__(self, db_file: str, pdf_id: int, owner: str, lease_seconds: float = PDF_LEASE_SECONDS):
+        super().__init__(daemon=True)
+        self.db_file = db_file
+        self.pdf_id = pdf_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        # An in-memory database cannot be shared with another process, so there is nothing to guard
+        if not self.db_file:
+            return
+        conn = create_write_connection(self.db_file)
+        try:
+            while not self._stop_event.wait(self.lease_seconds / 3):
+                try:
+                    if not renew_pdf_lease(conn, self.pdf_id, self.owner, self.lease_seconds):
+                        logger.warning(f"Lost the lease on PDF {self.pdf_id}.")
+                        self.lost = True
+                        return
+                except sqlite3.OperationalError as e:
+                    # e.g. "database is locked" past busy_timeout; the lease has time left for another try
+                    logger.warning(f"Could not extend the lease on PDF {self.pdf_id}: {e}")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _process_and_store_checkpointed(conn, pdf_path: str, claimed: Dict[str, Any], owner: str, pages_total: int,
+                                    stale_pdf_ids: List[int], progress: Optional[Callable[[int, int], None]],
+                                    keeper: _PdfLeaseKeeper) -> int:
+    pdf_id = claimed["id"]
+    pages_done = claimed["pages_done"]
+    ocr_info = {"ocr_path": pdf_path, "ocr_pages": 0, "ocr_status": OCR_NOT_NEEDED, "ocr_error": None}
+    stale_pdf_ids = [stale_id for stale_id in stale_pdf_ids if stale_id != pdf_id]
+    if claimed["ocr_status"] is not None:
+        ocr_info.update(ocr_path=claimed["ocr_path"], ocr_status=claimed["ocr_status"], ocr_error=claimed["ocr_error"])
+    if pages_done:
+        logger.info(f"Resuming PDF '{pdf_path}' after {len(pages_done)} of {pages_total} page(s).")
+
+    def checkpoint(page_results):
+        if keeper.lost:
+            raise PdfLeaseLost(f"PDF {pdf_id} is no longer leased by {owner}")
+        store_page_results(conn, pdf_id, owner, page_results, ocr_info["ocr_path"], ocr_info["ocr_path"] != pdf_path,
+                           ocr_info["ocr_status"], ocr_info["ocr_error"])
+
+    pages = iter_page_texts(pdf_path, ocr_info, skip_pages=pages_done)
+    if progress is not None:
+        progress(len(pages_done), pages_total)
+    items = ((text, (page_number, text)) for page_number, text in pages)
+    page_results = []
+    for pages_seen, ((page_number, text), dates) in enumerate(extract_dates_batched(items, context_words=None, n_process=1),
+                                                             start=len(pages_done) + 1):
+        for date in dates:
+            date["page_number"] = page_number
+        page_results.append((page_number, text, dates))
+        if len(page_results) >= CHECKPOINT_PAGES:
+            checkpoint(page_results)
+            page_results = []
+        if progress is not None:
+            progress(pages_seen, pages_total)
+    if page_results:
+        checkpoint(page_results)
+
+    ocr_pdf_path = ocr_info["ocr_path"]
+    finish_pdf(conn, pdf_id, owner, ocr_pdf_path, ocr_pdf_path != pdf_path, ocr_info["ocr_status"],
+               ocr_info["ocr_error"], stale_pdf_ids)
+    return pdf_id
@@ -0,0 +1,67 @@
+"""
+Inspect and finish PDFs whose processing was interrupted part way.
+
+Usage:
+    python -m pdf_processing.resume list [--db data/my_project_database.db]
+    python -m pdf_processing.resume finish [--db data/my_project_database.db]
+
+Queue jobs resume by themselves once their lease expires; this is for documents processed
+outside the queue, or whose job has already failed.
+"""
+import argparse
+import logging
+import os
+import time
+
+from database.connection import DEFAULT_DB_PATH, create_write_connection
+from database.operations import initialize_database, fetch_in_progress_pdfs
+
+logger = logging.getLogger(__name__)
+
+
+def finish_in_progress_pdfs(conn) -> int:
+    """
+    Resume every in-progress PDF from its last checkpoint.
+    :return: Number of PDFs completed.
+    """
+    # Imported here so `list` does not load the NER model
+    from pdf_processing.processor import process_and_store_pdf
+
+    finished = 0
+    for pdf in fetch_in_progress_pdfs(conn):
+        if pdf["lease_owner"] is not None and (pdf["lease_expires_at"] or 0) >= time.time():
+            logger.info(f"Skipping PDF {pdf['id']}: {pdf['lease_owner']} is still working on it.")
+            continue
+        if not os.path.exists(pdf["original_path"]):
+            logger.error(f"Cannot resume PDF {pdf['id']}: '{pdf['original_path']}' no longer exists.")
+            continue
+        try:
+            process_and_store_pdf(conn, pdf["original_path"], pdf["content_hash"])
+            finished += 1
+        except Exception as e:
+            logger.error(f"Error resuming PDF '{pdf['original_path']}': {e}")
+    return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or finish PDFs whose processing was interrupted.")
+    parser.add_argument("command", choices=["list", "finish"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the SQLite database file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    conn = create_write_connection(args.db)
+    try:
+        initialize_database(conn)
+        if args.command == "list":
+            for pdf in fetch_in_progress_pdfs(conn):
+                print(f"{pdf['id']}\t{pdf['pages_done']}/{pdf['page_count']}\t{pdf['extractor_version']}\t"
+                      f"{pdf['lease_owner'] or '-'}\t{pdf['original_path']}")
+        else:
+            print(f"Finished {finish_in_progress_pdfs(conn)} PDF(s).")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import re
+from bisect import bisect_left, bisect_right
+from typing import List
+
+word_regex = re.compile(r"\S+")
+
+
+class WordIndex:
+    """
+    Character offsets of the whitespace-separated words of one page, built once.
+    Context windows around a character span are then found with a binary search
+    instead of re-splitting the text for every date.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for match in word_regex.finditer(text):
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+
+    def context(self, start_char: int, end_char: int, context_words: int) -> str:
+        """
+        Return the words overlapping [start_char, end_char) plus context_words words on each side.
+        :param start_char: Offset of the first character of the span.
+        :param end_char: Offset just past the last character of the span.
+        :param context_words: Number of words to keep on each side of the span.
+        :return: The words of the window joined by single spaces.
+        """
+        first = bisect_right(self.ends, start_char)
+        last = bisect_left(self.starts, end_char)
+        lo = max(0, first - context_words)
+        hi = min(len(self.starts), last + context_words)
+        return ' '.join(self.text[self.starts[i]:self.ends[i]] for i in range(lo, hi))
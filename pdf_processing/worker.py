@@ -0,0 +1,249 @@
+"""
+Queue workers: separate processes that drain the Jobs table.
+
+Usage: python -m pdf_processing.worker [--processes 4] [--db data/my_project_database.db] [--ner-server]
+
+Each process repeatedly claims a job, processes the PDF with pdf_processing.processor and
+records the outcome. The NER model is loaded on a process's first job, or with --ner-server
+all of them share one copy in a pdf_processing.ner_server process. A heartbeat thread extends
+the job's lease and publishes page progress while the PDF is being worked on.
+
+Concurrency: each worker process handles one job at a time, and within a job OCR runs
+synchronously (the process waits for its ocrmypdf subprocess). Processes started together by
+start_workers share one semaphore of OCR_MAX_JOBS slots, so at most that many OCR subprocesses
+run across all of them; separately started worker groups (e.g. the API's workers and a
+`python -m pdf_processing.worker` run) each have their own limit.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import socket
+import sqlite3
+import threading
+import time
+
+from database.connection import DEFAULT_DB_PATH, create_write_connection
+from database.jobs import (JOB_LEASE_SECONDS, claim_job, complete_job, fail_job, heartbeat_job)
+from database.operations import initialize_database
+from monitoring.profiler import PROFILE_DIR, PROFILE_MIN_SECONDS, SamplingProfiler
+from pdf_processing.ocr import OCR_MAX_JOBS
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before polling the queue again
+POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+
+# Seconds a worker gets to exit after being told to stop at once, before it is killed
+KILL_GRACE_SECONDS = float(os.environ.get("WORKER_KILL_GRACE_SECONDS", 5))
+
+
+class JobLeaseLost(Exception):
+    """Raised inside a running job once its lease has passed to another worker."""
+
+
+class _LeaseKeeper(threading.Thread):
+    """
+    Extends a job's lease every third of the lease period and records the latest progress.
+    Once the lease is lost the job is aborted at its next progress report, so two workers
+    never go on processing the same job.
+    """
+
+    def __init__(self, db_path, job_id, owner, lease_seconds):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.job_id = job_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.pages_done = None
+        self.pages_total = None
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def progress(self, pages_done, pages_total):
+        if self.lost:
+            raise JobLeaseLost(f"Lost the lease on job {self.job_id}")
+        self.pages_done = pages_done
+        self.pages_total = pages_total
+
+    def run(self):
+        conn = create_write_connection(self.db_path)
+        try:
+            while not self._stop_event.wait(self.lease_seconds / 3):
+                try:
+                    renewed = heartbeat_job(conn, self.job_id, self.owner, self.lease_seconds,
+                                            self.pages_done, self.pages_total)
+                except sqlite3.OperationalError as e:
+                    # e.g. "database is locked" past busy_timeout; the lease has time left for another try
+                    logger.warning(f"Could not extend the lease on job {self.job_id}: {e}")
+                    continue
+                if not renewed:
+                    logger.warning(f"Lost the lease on job {self.job_id}; aborting it.")
+                    self.lost = True
+                    return
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _save_profile(profiler, job):
+    if profiler is None or profiler.seconds < PROFILE_MIN_SECONDS:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"job-{job['id']}.stacks")
+    profiler.write(path)
+    logger.info(f"Job {job['id']} took {profiler.seconds:.1f}s; profile written to {path}.")
+
+
+def run_job(conn, db_path, job, owner, lease_seconds=JOB_LEASE_SECONDS):
+    """Process one claimed job and record its outcome."""
+    # Imported here so the API process, which only enqueues, never loads the NER model
+    from pdf_processing.processor import process_and_store_pdf
+
+    keeper = _LeaseKeeper(db_path, job["id"], owner, lease_seconds)
+    keeper.start()
+    profiler = SamplingProfiler() if PROFILE_DIR else None
+    try:
+        if profiler is not None:
+            with profiler:
+                pdf_id = process_and_store_pdf(conn, job["pdf_path"], job["content_hash"], progress=keeper.progress)
+        else:
+            pdf_id = process_and_store_pdf(conn, job["pdf_path"], job["content_hash"], progress=keeper.progress)
+    except Exception as e:
+        keeper.stop()
+        _save_profile(profiler, job)
+        logger.error(f"Job {job['id']} for '{job['pdf_path']}' failed: {e}")
+        fail_job(conn, job["id"], owner, str(e))
+        return
+    keeper.stop()
+    _save_profile(profiler, job)
+    heartbeat_job(conn, job["id"], owner, lease_seconds, keeper.pages_done, keeper.pages_total)
+    complete_job(conn, job["id"], owner, pdf_id)
+
+
+def run_worker(db_path=DEFAULT_DB_PATH, stop_event=None, lease_seconds=JOB_LEASE_SECONDS, poll_interval=POLL_INTERVAL):
+    """
+    Claim and process jobs until stop_event is set.
+    :param db_path: Path to the SQLite database file.
+    :param stop_event: threading or multiprocessing Event; the worker finishes its current job and returns once set.
+    :param lease_seconds: Lease period of claimed jobs.
+    :param poll_interval: Seconds to wait when the queue is empty.
+    """
+    logging.basicConfig(level=logging.INFO)
+    stop_event = stop_event or threading.Event()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    conn = create_write_connection(db_path)
+    initialize_database(conn)
+    logger.info(f"Worker {owner} started.")
+    try:
+        while not stop_event.is_set():
+            job = claim_job(conn, owner, lease_seconds)
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+            run_job(conn, db_path, job, owner, lease_seconds)
+    finally:
+        conn.close()
+        logger.info(f"Worker {owner} stopped.")
+
+
+def _worker_process_main(db_path, stop_event, ocr_slots):
+    from pdf_processing.processor import _init_worker
+    _init_worker(ocr_slots)
+    # Ctrl+C and SIGTERM reach the whole process group; turn both into a graceful stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def _terminate(signum, frame):
+        if not stop_event.is_set():
+            stop_event.set()
+            return
+        # Already asked to stop and still busy: stop now. OCR runs in its own process group,
+        # so it is killed here rather than left behind; the job's lease expires and it is retried.
+        from pdf_processing.processor import cancel_ocr
+        cancel_ocr()
+        raise SystemExit(1)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    run_worker(db_path, stop_event)
+
+
+def start_workers(count, db_path=DEFAULT_DB_PATH):
+    """
+    Start worker processes. Uses the spawn start method so workers never inherit the caller's
+    threads or event loop. Their OCR jobs share one limit of OCR_MAX_JOBS.
+    :return: (list of processes, event that asks them to stop)
+    """
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    ocr_slots = context.BoundedSemaphore(OCR_MAX_JOBS)
+    processes = [context.Process(target=_worker_process_main, args=(db_path, stop_event, ocr_slots),
+                                 name=f"pdf-worker-{n}")
+                 for n in range(count)]
+    for process in processes:
+        # start() drops its reference to the args; the semaphore must outlive this call for the
+        # spawned processes to attach to it
+        process.ocr_slots = ocr_slots
+        process.start()
+    return processes, stop_event
+
+
+def stop_workers(processes, stop_event, timeout=None):
+    """
+    Ask workers to stop after their current job and wait for them. Workers still busy after
+    timeout seconds are sent SIGTERM, which makes them kill their OCR jobs and exit, and are
+    killed if they have not exited KILL_GRACE_SECONDS later. The job's lease expires and another
+    worker picks it up.
+    """
+    stop_event.set()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for process in processes:
+        process.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+    busy = [process for process in processes if process.is_alive()]
+    for process in busy:
+        process.terminate()
+    deadline = time.monotonic() + KILL_GRACE_SECONDS
+    for process in busy:
+        process.join(max(deadline - time.monotonic(), 0))
+        if process.is_alive():
+            # e.g. stuck in a long C call that the signal handler cannot interrupt
+            process.kill()
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run worker processes that drain the PDF processing queue.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the SQLite database file")
+    parser.add_argument("--ner-server", action="store_true", help="Share one NER model between the workers")
+    args = parser.parse_args()
+
+    ner_server = None
+    if args.ner_server:
+        from pdf_processing.ner_server import DEFAULT_ADDRESS, start_ner_server
+        # Without a configured key, a random one for this run; the server unpickles what clients send
+        authkey = os.environ.get("NER_SERVER_AUTHKEY") or secrets.token_hex(32)
+        ner_server = start_ner_server(DEFAULT_ADDRESS, authkey.encode())
+        # Spawned workers read the address and key from the environment they inherit
+        os.environ["NER_SERVER_ADDRESS"] = DEFAULT_ADDRESS
+        os.environ["NER_SERVER_AUTHKEY"] = authkey
+    processes, stop_event = start_workers(args.processes, args.db)
+    # SIGTERM and Ctrl+C both let workers finish the job they are on
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_workers(processes, stop_event)
+    finally:
+        if ner_server is not None:
+            ner_server.terminate()
+            ner_server.join()
+
+
+if __name__ == '__main__':
+    main()